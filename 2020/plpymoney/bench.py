@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+
+r"""
+Time the parsing of synthetic Chase Bank Statements, to show how the cost grows with size
+
+Work just enough to imitate the lines of statements, without sharing any real statement
+
+Time just 'chase.pdf_parse' by default, else with '--suite' time the whole of
+'chase.main', 'mark.main', and 'run-break-fix.py', each in a fresh process, over
+trees of 1, 10, 100, ... statements, and compare their rows per second to a baseline
+"""
+
+
+import argparse
+import csv
+import decimal
+import json
+import os
+import random
+import re
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+import chase
+import ledger
+
+
+STATEMENT_YYYYMMDD = '20200131'
+STATEMENT_ACCOUNT = '1234'
+
+SUITE_SCALES = '1,10,100,1000'  # up to 10000, with patience
+SUITE_STEPS = ('chase', 'mark', 'run-break-fix',)
+
+BASELINE_PATH = 'bench-baseline.json'
+BASELINE_TOLERANCE = 0.25  # fail if rows per second drop by more than this fraction
+
+AMOUNT_GRAMMAR_REGEX = re.compile(r'-?([0-9]{1,3}(,[0-9]{3})+|[0-9]*)[.][0-9]{1,2}')
+    # the amounts that 'ledger.cents_from_amount' must take, and no others
+
+MONTHS_PER_ACCOUNT = 120  # 10 years of statements, per account, past 3 accounts
+
+MERCHANTS = textwrap.dedent("""
+    AMAZON MKTPLACE PMTS
+    CHEVRON 0209876
+    COSTCO WHSE #0001
+    NETFLIX.COM
+    SAFEWAY #1234
+    TRADER JOE'S #123
+""").strip().splitlines()
+
+
+def main(argv):
+    """Run from the command line"""
+
+    parser = bench_compile_argdoc()
+    args = parser.parse_args(argv[1:])
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    if args.suite:
+        run_suite(args)
+        return
+
+    if args.fuzz_amounts:
+        fuzz_amounts(args.fuzz_amounts)
+        return
+
+    print('Lines', 'Seconds', 'Microseconds Per Line', sep='\t')
+
+    len_transactions = args.transactions
+    for _ in range(args.doublings):
+
+        lines = synthetic_statement_lines(
+            'CREDIT CARD', len_transactions=len_transactions, len_junk_lines=args.junk)
+        seconds = time_pdf_parse('CREDIT CARD', lines=lines)
+
+        usecs_per_line = (seconds * 1e6 / len(lines))
+        print(len(lines), '{:.3f}'.format(seconds), '{:.3f}'.format(usecs_per_line), sep='\t')
+
+        len_transactions *= 2
+
+
+def bench_compile_argdoc():
+    """Construct the helplines for a parser, and the parser itself, to parse a command line"""
+
+    parser = argparse.ArgumentParser(
+        prog='bench',
+        formatter_class=argparse.RawTextHelpFormatter,
+        )
+
+    parser.add_argument('--transactions', metavar='N', type=int, default=1000,
+        help='count transactions of the first statement (default: 1000)')
+    parser.add_argument('--doublings', metavar='N', type=int, default=6,
+        help='count statements to time, each twice as large as the last (default: 6)')
+    parser.add_argument('--junk', metavar='N', type=int, default=10,
+        help='count up to N lines between transactions (default: 10)')
+
+    parser.add_argument('--suite', action='store_true',
+        help='time chase, mark, and run-break-fix over trees of synthetic statements')
+    parser.add_argument('--scales', metavar='N,N,...', default=SUITE_SCALES,
+        help='count statements of each tree of the suite (default: {})'.format(SUITE_SCALES))
+    parser.add_argument('--baseline', metavar='PATH', default=BASELINE_PATH,
+        help='compare rows per second to the results kept here (default: {})'.format(
+            BASELINE_PATH))
+    parser.add_argument('--save-baseline', action='store_true',
+        help='keep the results of this suite as the baseline, in place of comparing them')
+    parser.add_argument('--repeat', metavar='N', type=int, default=3,
+        help='time each step N times, and keep the best (default: 3)')
+    parser.add_argument('--tolerance', metavar='F', type=float, default=BASELINE_TOLERANCE,
+        help='fail if rows per second drop by more than F of the baseline (default: {})'.format(
+            BASELINE_TOLERANCE))
+
+    parser.add_argument('--fuzz-amounts', metavar='N', type=int,
+        help='check the amount codec against Decimal, over N random amounts, valid or not')
+
+    parser.add_argument('--child', metavar='STEP', choices=SUITE_STEPS,
+        help=argparse.SUPPRESS)  # to time one step inside a fresh process
+
+    return parser
+
+
+def run_suite(args):
+    """Time each step over each tree, print the results, and compare them to a baseline"""
+
+    scales = [int(_) for _ in args.scales.split(',')]
+
+    baseline = dict()
+    if (not args.save_baseline) and os.path.exists(args.baseline):
+        with open(args.baseline) as reading:
+            baseline = json.load(reading)
+
+    print('Statements', 'Step', 'Rows', 'Seconds', 'Rows Per Second', 'Peak Rss MiB', 'Vs Baseline',
+        sep='\t')
+
+    results = dict()
+    slowdowns = []
+    for len_statements in scales:
+        with tempfile.TemporaryDirectory(prefix='bench-') as root:
+            synthetic_tree(root, len_statements=len_statements)
+
+            for step in SUITE_STEPS:
+                results_ = [time_child(step, cwd=root) for _ in range(args.repeat)]
+                result = min(results_, key=lambda _: _['seconds'])  # best of, to shrug off noise
+
+                key = '{} {}'.format(len_statements, step)
+                results[key] = result
+
+                vs = ''
+                if key in baseline:
+                    ratio = result['rows_per_second'] / baseline[key]['rows_per_second']
+                    vs = '{:.2f}x'.format(ratio)
+                    if ratio < (1 - args.tolerance):
+                        slowdowns.append('{} at {}'.format(key, vs))
+
+                print(len_statements, step, result['rows'], '{:.3f}'.format(result['seconds']),
+                    '{:.0f}'.format(result['rows_per_second']),
+                    '{:.1f}'.format(result['peak_rss_kib'] / 1024), vs, sep='\t')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as writing:
+            json.dump(results, writing, indent=2, sort_keys=True)
+            writing.write('\n')
+
+    if slowdowns:
+        sys.exit('bench: slower than baseline: {}'.format(', '.join(slowdowns)))
+
+
+def time_child(step, cwd):
+    """Time one step inside a fresh process, to measure the peak Rss of that step alone"""
+
+    argv = [sys.executable, os.path.abspath(__file__), '--child', step]
+    run = subprocess.run(argv, cwd=cwd, stdout=subprocess.PIPE, check=True, universal_newlines=True)
+
+    last_line = run.stdout.splitlines()[-1]
+    result = json.loads(last_line)
+
+    return result
+
+
+def run_child(step):
+    """Time one step, and print its Json as the last line of Stdout"""
+
+    import mark
+
+    dirname = os.path.dirname(os.path.abspath(__file__))
+
+    for path in (chase.CACHE_PATH, mark.CACHE_PATH,):  # to time parsing, not the caches
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(chase.PARTITIONS_DIR, ignore_errors=True)  # to parse each account again
+
+    t0 = time.perf_counter()
+
+    if step == 'chase':
+        rows = len(chase.main())
+    elif step == 'mark':
+        mark.main()
+        with open('chase-mark-csv.csv') as reading:
+            rows = max(0, len(list(csv.reader(reading))) - 1)
+    else:
+        assert step == 'run-break-fix'
+        globals_ = runpy.run_path(os.path.join(dirname, 'run-break-fix.py'))
+        rows = len(globals_['batch'])
+
+    t1 = time.perf_counter()
+
+    seconds = (t1 - t0)
+    peak_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # wart: KiB at Linux
+
+    result = dict(
+        rows=rows, seconds=seconds, rows_per_second=(rows / seconds), peak_rss_kib=peak_rss_kib)
+
+    print(json.dumps(result))
+
+
+def fuzz_amounts(len_amounts, seed=0):
+    """Check 'ledger.cents_from_amount' and its bulk variant against Decimal, and time them"""
+
+    rand = random.Random(seed)
+
+    amounts = []
+    for _ in range(len_amounts):
+        if rand.random() < 0.5:
+            amount = rand_amount(rand, signed=True)
+            if rand.random() < 0.25:
+                amount = amount.replace(',', '')  # as Chase formats some amounts
+            if rand.random() < 0.25:
+                amount = amount[:-1]  # as '1.5'
+        else:
+            amount = ''.join(rand.choice('0123456789,.-') for _ in range(rand.randint(0, 9)))
+
+        amounts.append(amount)
+
+    # Require the same cents as Decimal gives, and the same refusals
+
+    mismatches = []
+    valid_amounts = []
+    for amount in amounts:
+        try:
+            cents = ledger.cents_from_amount(amount)
+        except ValueError:
+            cents = None
+
+        decimal_cents = None
+        if AMOUNT_GRAMMAR_REGEX.fullmatch(amount):
+            decimal_cents = int(decimal.Decimal(amount.replace(',', '')) * 100)
+            valid_amounts.append(amount)
+
+        if cents != decimal_cents:
+            mismatches.append((amount, cents, decimal_cents,))
+
+    bulk_cents = ledger.cents_from_amounts(valid_amounts)
+    decimal_cents = [int(decimal.Decimal(_.replace(',', '')) * 100) for _ in valid_amounts]
+    if bulk_cents.tolist() != decimal_cents:
+        mismatches.append(('bulk', len(bulk_cents), len(decimal_cents),))
+
+    if len(valid_amounts) < len(amounts):
+        try:
+            ledger.cents_from_amounts(amounts)
+            mismatches.append(('bulk took invalid amounts', len(amounts), len(valid_amounts),))
+        except ValueError:
+            pass
+
+    # Time each over the valid amounts
+
+    t0 = time.perf_counter()
+    for amount in valid_amounts:
+        ledger.cents_from_amount(amount)
+    t1 = time.perf_counter()
+    ledger.cents_from_amounts(valid_amounts)
+    t2 = time.perf_counter()
+
+    usecs = 1e6 / max(len(valid_amounts), 1)
+    print('Amounts', 'Valid', 'Mismatches', 'Microseconds Per Amount', 'In Bulk', sep='\t')
+    print(len(amounts), len(valid_amounts), len(mismatches),
+        '{:.3f}'.format((t1 - t0) * usecs), '{:.3f}'.format((t2 - t1) * usecs), sep='\t')
+
+    for mismatch in mismatches[:10]:
+        print('mismatch:', mismatch)
+
+    if mismatches:
+        sys.exit(1)
+
+
+def synthetic_tree(root, len_statements, len_transactions=50):
+    """Write a Dir of Dir's of statements, as downloaded from Chase Bank, and a category Csv"""
+
+    len_accounts = max(3, -(-len_statements // MONTHS_PER_ACCOUNT))  # wart: ceil by floor
+    for index in range(len_statements):
+        (month_index, account_index,) = divmod(index, len_accounts)
+
+        pdf_tag = chase.PDF_TAGS[account_index % len(chase.PDF_TAGS)]
+        account = '{:04}'.format(1001 + account_index)
+
+        (years, month0,) = divmod(month_index, 12)
+        yyyymmdd = '{}{:02}28'.format(2010 + years, month0 + 1)
+        months = (((month0 - 1) % 12) + 1, month0 + 1,)  # the month before, and the month
+
+        lines = synthetic_statement_lines(
+            pdf_tag, len_transactions=len_transactions, seed=index, months=months)
+
+        filepath = os.path.join(root, statement_filepath(pdf_tag, yyyymmdd=yyyymmdd, account=account))
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as writing:
+            writing.write('\n'.join(lines) + '\n')
+
+    with open(os.path.join(root, 'category-by-merchant-csv.csv'), 'w') as writing:
+        csv_writer = csv.writer(writing)
+        csv_writer.writerow(('', 'Category', 'Merchant',))
+        for merchant in MERCHANTS[:-1]:  # leave one merchant uncategorized
+            csv_writer.writerow(('', 'Shopping', merchant,))
+
+
+def time_pdf_parse(pdf_tag, lines):
+    """Count the seconds taken to parse the lines of one statement"""
+
+    filepath = statement_filepath(pdf_tag)
+
+    t0 = time.perf_counter()
+    chase.pdf_parse(pdf_tag, filepath=filepath, texts=chase.lines_texts(lines))
+    t1 = time.perf_counter()
+
+    seconds = (t1 - t0)
+    return seconds
+
+
+def statement_filepath(pdf_tag, yyyymmdd=STATEMENT_YYYYMMDD, account=STATEMENT_ACCOUNT):
+    """Form the filepath of a statement, as downloaded from Chase Bank"""
+
+    filepath = './{} (...{})/{}-statements-{}-.pdf'.format(pdf_tag, account, yyyymmdd, account)
+    return filepath
+
+
+def synthetic_statement_lines(pdf_tag, len_transactions, len_junk_lines=10, seed=0, months=(12, 1)):
+    """Imitate the lines of one statement, as found inside its Pdf"""
+
+    rand = random.Random(seed)
+
+    lines = list(synthetic_junk_lines(rand, len_lines=200))
+    if pdf_tag == 'TOTAL CHECKING':
+        lines.append('(TRANSACTION DETAIL)Tj')
+
+    for _ in range(len_transactions):
+        if pdf_tag == 'CREDIT CARD':
+            lines.extend(synthetic_credit_card_lines(rand, months=months))
+        else:
+            assert pdf_tag == 'TOTAL CHECKING'
+            lines.extend(synthetic_total_checking_lines(rand, months=months))
+
+        lines.extend(synthetic_junk_lines(rand, len_lines=rand.randrange(len_junk_lines)))
+
+    if pdf_tag == 'TOTAL CHECKING':
+        lines.append('[( CHASE SAVINGS)] TJ')
+    lines.extend(synthetic_junk_lines(rand, len_lines=200))
+
+    return lines
+
+
+def synthetic_credit_card_lines(rand, months):
+    """Imitate the Tj-Tm pairs of one Credit Card Transaction, sometimes with odd variants"""
+
+    lines = [tj(rand_date_of(rand, months=months)), rand_tm(rand), tj(' '), rand_tm(rand)]
+
+    if rand.random() < 0.05:
+        lines.extend(['[( )] TJ', rand_tm(rand), '(&)Tj', rand_tm(rand)])
+
+    lines.extend([tj(rand.choice(MERCHANTS)), rand_tm(rand), tj(rand_amount(rand, signed=True))])
+
+    if rand.random() < 0.05:
+        lines.append('0 0 0 1 k')
+
+    lines.append(rand_tm(rand))
+
+    return lines
+
+
+def synthetic_total_checking_lines(rand, months):
+    """Imitate the Tj-Tm pairs of one Total Checking Transaction, sometimes with odd variants"""
+
+    date_of = rand_date_of(rand, months=months)
+
+    if rand.random() < 0.10:
+        lines = [tj(date_of), rand_tm(rand), tj('Deposit 1234567890'), rand_tm(rand)]
+        lines.extend([tj(rand_amount(rand)), rand_tm(rand)])
+        return lines
+
+    merchant = 'Card Purchase {} {} Card 1234'.format(
+        rand_date_of(rand, months=months), rand.choice(MERCHANTS))
+
+    lines = [tj(date_of), rand_tm(rand), tj(merchant), rand_tm(rand)]
+
+    if rand.random() < 0.05:
+        lines.extend([tj('Card Purchase With Pin'), rand_tm(rand)])
+
+    lines.extend([tj('-'), rand_tm(rand)])
+    lines.extend([tj(rand_amount(rand)), rand_tm(rand)])
+    lines.extend([tj(rand_amount(rand)), rand_tm(rand)])
+
+    return lines
+
+
+def synthetic_junk_lines(rand, len_lines):
+    """Imitate the lines between transactions"""
+
+    junks = ['BT', 'ET', '/F1 8 Tf', '0 g', 'q', 'Q', '(Page)Tj', '[(Transactions)] TJ']
+
+    lines = [rand.choice(junks) for _ in range(len_lines)]
+    return lines
+
+
+def tj(chars):
+    """Form a Tj line to show some chars"""
+
+    line = '({})Tj'.format(chars)
+    return line
+
+
+def rand_tm(rand):
+    """Form a Tm line to move the text cursor"""
+
+    line = '1 0 0 1 {:.2f} {:.2f} Tm'.format(rand.uniform(0, 612), rand.uniform(0, 792))
+    return line
+
+
+def rand_date_of(rand, months):
+    """Pick a Chase "Date of" from the month of the statement, or the month before"""
+
+    month = rand.choice(months)
+    day = rand.randint(1, 28)
+
+    date_of = '{:02}/{:02}'.format(month, day)
+    return date_of
+
+
+def rand_amount(rand, signed=False):
+    """Pick an amount, formatted as Chase formats it"""
+
+    cents = rand.randint(1, 250000)
+    amount = '{:,}.{:02}'.format(cents // 100, cents % 100)
+    if signed and (rand.random() < 0.10):
+        amount = '-' + amount
+
+    return amount
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+r"""
+Find the category of a merchant, by rules of exact, prefix, substring, or regex match
+
+Compile all the rules into one index, so the cost per merchant grows with the length of
+the merchant, not with the count of rules
+"""
+
+
+import itertools
+import re
+
+
+MATCHES = ('exact', 'prefix', 'substring', 'regex',)  # in order of precedence
+
+REGEX_LITERAL_REGEX = re.compile(r'[A-Za-z0-9 #&\',/-]*')  # chars that match only themselves
+REGEX_QUANTIFIERS = '*+?{'
+
+REGEX_GLOBAL_FLAGS_REGEX = re.compile(r'^[(][?]([aiLmsux]+)[)]')  # such as '(?i)'
+
+
+class CategoryIndex(object):
+    """Find the category of a merchant, by rules compiled into one index"""
+
+    def __init__(self):
+
+        self.category_by_merchant = dict()  # exact rules
+
+        self.prefix_trie = dict()  # dict of dicts of chars, with each category at key None
+
+        self.category_by_substring = dict()  # substring rules, in order added
+        self.automaton = None  # built from the substring rules, by 'compile'
+
+        self.category_by_regex = dict()  # regex rules, in order added
+        self.regexes = None  # (regex, category,) of each regex rule, by 'compile'
+        self.regex_trie = None  # alternations of regex rules, by their literal prefixes
+
+    def add(self, category, merchant, match='exact'):
+        """Add one rule, letting it replace an earlier rule of the same match and merchant"""
+
+        if match == 'exact':
+            self.category_by_merchant[merchant] = category
+
+        elif match == 'prefix':
+            node = self.prefix_trie
+            for char in merchant:
+                node = node.setdefault(char, dict())
+            node[None] = category
+
+        elif match == 'substring':
+            assert merchant, (category, merchant,)
+            self.category_by_substring[merchant] = category
+
+        else:
+            assert match == 'regex', (match, category, merchant,)
+            scoped = regex_scoped(merchant)
+            if not re.compile(scoped).groups:  # raise re.error now, not later
+                re.compile('(?P<r0>{})'.format(scoped))  # as 'compile' will join it
+            self.category_by_regex[merchant] = category
+
+        self.automaton = None
+        self.regex_trie = None
+
+    def compile(self):
+        """Build the automaton of the substring rules, and the alternations of the regex rules"""
+
+        self.automaton = SubstringAutomaton(list(self.category_by_substring.items()))
+
+        # File each regex under its literal prefix, to try only regexes that could match
+
+        self.regexes = list(self.category_by_regex.items())
+
+        trie = dict()
+        for (index, (regex, _,),) in enumerate(self.regexes):
+            node = trie
+            for char in regex_literal_prefix(regex):
+                node = node.setdefault(char, dict())
+            node.setdefault(None, []).append((index, regex_scoped(regex),))
+
+        # Join the regexes filed at each node into one alternation, except the regexes with
+        # groups of their own, as joining them would renumber their backreferences
+
+        nodes = [trie]
+        for node in nodes:  # wart: grows while iterating
+            filed = node.pop(None, None)
+            nodes.extend(node.values())
+            if filed:
+                patterns = []  # (pattern, index,) of each regex alone, and None for the joined
+                alternatives = []
+                for (index, regex,) in filed:
+                    pattern = re.compile(regex)
+                    if pattern.groups:
+                        patterns.append((pattern, index,))
+                    else:
+                        alternatives.append('(?P<r{}>{})'.format(index, regex))
+
+                if alternatives:
+                    patterns.append((re.compile('|'.join(alternatives)), None,))
+
+                node[None] = patterns
+
+        self.regex_trie = trie
+
+    def classify(self, merchant):
+        """Find the category of a merchant, else return None"""
+
+        if self.automaton is None:
+            self.compile()
+
+        # Take the exact match
+
+        category = self.category_by_merchant.get(merchant)
+        if category is not None:
+            return category
+
+        # Else take the longest prefix match
+
+        node = self.prefix_trie
+        for char in merchant:
+            node = node.get(char)
+            if node is None:
+                break
+            category = node.get(None, category)
+
+        if category is not None:
+            return category
+
+        # Else take the longest substring match, else the first added
+
+        category = self.automaton.search(merchant)
+        if category is not None:
+            return category
+
+        # Else take the first regex that matches all of the merchant
+
+        first_index = None
+
+        node = self.regex_trie
+        for char in itertools.chain(merchant, [None]):
+            for (pattern, index,) in node.get(None, ()):
+                matched = pattern.fullmatch(merchant)
+                if matched:
+                    if index is None:
+                        index = int(matched.lastgroup[len('r'):])
+                    if (first_index is None) or (index < first_index):
+                        first_index = index
+
+            node = node.get(char) if (char is not None) else None
+            if node is None:
+                break
+
+        if first_index is not None:
+            (_, category,) = self.regexes[first_index]
+            return category
+
+        return None
+
+
+def regex_scoped(regex):
+    """Rewrite the global flags at the start of a regex as scoped flags, such as '(?i:...)'"""
+
+    flags = ''
+    while True:
+        matched = REGEX_GLOBAL_FLAGS_REGEX.match(regex)
+        if not matched:
+            break
+        flags += matched.group(1)
+        regex = regex[matched.end():]
+
+    if not flags:
+        return regex
+
+    flags = ''.join(dict.fromkeys(flags))  # each once, in order
+    ending = '\n' if ('x' in flags) else ''  # to end a verbose '#' comment before the ')'
+
+    scoped = '(?{}:{}{})'.format(flags, regex, ending)
+    return scoped
+
+
+def regex_literal_prefix(regex):
+    """Find the chars that every match of a regex must start with"""
+
+    if ('|' in regex) or ('(?' in regex):  # wart: gives up on alternations and flags anywhere
+        return ''
+
+    prefix = REGEX_LITERAL_REGEX.match(regex).group()
+    if regex[len(prefix):][:1] in tuple(REGEX_QUANTIFIERS):
+        prefix = prefix[:-1]  # as the quantifier applies to the last char
+
+    return prefix
+
+
+class SubstringAutomaton(object):
+    """Find the longest of many substrings in one pass over a string, as Aho & Corasick did"""
+
+    def __init__(self, patterns):
+
+        self.gotos = [dict()]  # the next state, by char, of each state
+        self.fails = [0]  # the state of the longest proper suffix, of each state
+        self.outputs = [None]  # (-len, index, category,) of the best pattern ending at each state
+
+        for (index, (pattern, category,),) in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                state = self.gotos[state].get(char) or self.add_state(state, char=char)
+
+            output = (-len(pattern), index, category,)
+            if (self.outputs[state] is None) or (output < self.outputs[state]):
+                self.outputs[state] = output
+
+        self.link_fails()
+
+    def add_state(self, state, char):
+        """Add a state after a state, by a char"""
+
+        next_state = len(self.gotos)
+        self.gotos[state][char] = next_state
+
+        self.gotos.append(dict())
+        self.fails.append(0)
+        self.outputs.append(None)
+
+        return next_state
+
+    def link_fails(self):
+        """Link each state to its longest proper suffix, breadth first, and inherit outputs"""
+
+        queue = list(self.gotos[0].values())
+        for state in queue:  # wart: grows while iterating, breadth first
+            for (char, next_state,) in self.gotos[state].items():
+                queue.append(next_state)
+
+                fail = self.fails[state]
+                while (char not in self.gotos[fail]) and fail:
+                    fail = self.fails[fail]
+                self.fails[next_state] = self.gotos[fail].get(char, 0)
+
+                inherited = self.outputs[self.fails[next_state]]
+                output = self.outputs[next_state]
+                if (output is None) or ((inherited is not None) and (inherited < output)):
+                    self.outputs[next_state] = inherited
+
+    def search(self, chars):
+        """Find the category of the longest pattern inside the chars, else return None"""
+
+        (gotos, fails, outputs,) = (self.gotos, self.fails, self.outputs,)
+
+        best = None
+        state = 0
+        for char in chars:
+            while (char not in gotos[state]) and state:
+                state = fails[state]
+            state = gotos[state].get(char, 0)
+
+            output = outputs[state]
+            if (output is not None) and ((best is None) or (output < best)):
+                best = output
+
+        if best is None:
+            return None
+
+        (_, _, category,) = best
+        return category
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+r"""
+Draw where the money goes, as Svg charts, from the sums by category by month
+
+Read only the sums written by mark.py --rollups, never the transactions, and draw stacked bars
+of each month, a treemap of each category, and a line of the money spent so far
+"""
+
+
+import datetime as dt
+import itertools
+import sys
+import xml.sax.saxutils
+
+import rollups
+
+
+CHART_PATHS = dict(
+    bars='spend-by-month-svg.svg',
+    treemap='spend-by-category-svg.svg',
+    line='spend-cumulative-svg.svg',
+    )
+
+LEFT_OUT = ('Check', 'Money',)  # as the total of 'sum-by-category-csv.csv' leaves them out
+
+COLORS = (
+    '#4e79a7', '#f28e2b', '#e15759', '#76b7b2', '#59a14f', '#edc948',
+    '#b07aa1', '#ff9da7', '#9c755f', '#bab0ac', '#86bcb6', '#d37295',
+    )
+
+WIDTH = 960
+HEIGHT = 480
+MARGIN = 60  # around the plot, for the axes and their labels
+LEGEND_WIDTH = 180  # right of the plot
+
+
+def main(argv):
+    """Run from the command line"""
+
+    when_launched = dt.datetime.now()
+
+    assert argv[1:] == [], argv  # wart: takes no options
+
+    (categories, cube,) = rollups.cube_load('month')
+    charts_dump(categories, cube=cube)
+
+    when_quit = dt.datetime.now()
+    print('Charts Py ran inside', when_quit - when_launched)
+
+
+def charts_dump(categories, cube):
+    """Draw each chart, from the sums by category by month"""
+
+    months = cube.labels
+
+    spends = []  # (cents, category, row,) of each category charted, costliest first
+    for (code, category,) in enumerate(categories):
+        if category not in LEFT_OUT:
+            row = [max(_, 0) for _ in cube.row(code)]
+            if sum(row):
+                spends.append((sum(row), (category or 'Uncategorized'), row,))
+
+    spends.sort(key=lambda _: (-_[0], _[1],))
+
+    color_by_category = dict(
+        (category, color,) for ((_, category, _,), color,) in zip(spends, itertools.cycle(COLORS)))
+
+    svg_dump(CHART_PATHS['bars'], svg_bars(months, spends, color_by_category))
+    svg_dump(CHART_PATHS['treemap'], svg_treemap(spends, color_by_category))
+    svg_dump(CHART_PATHS['line'], svg_line(months, spends))
+
+
+def svg_bars(months, spends, color_by_category):
+    """Draw the spend of each month as a bar, stacked by category, costliest at the bottom"""
+
+    totals = [sum(_) for _ in zip(*(row for (_, _, row,) in spends))] or [0] * len(months)
+    (top, ticks,) = axis_ticks(max(totals, default=0))
+
+    plot_width = WIDTH - 2 * MARGIN - LEGEND_WIDTH
+    plot_height = HEIGHT - 2 * MARGIN
+    bar_width = plot_width / max(len(months), 1)
+
+    lines = svg_axes(ticks, top=top, plot_width=plot_width, plot_height=plot_height)
+
+    for (column, month,) in enumerate(months):
+        x = MARGIN + column * bar_width
+        y = HEIGHT - MARGIN
+
+        for (_, category, row,) in spends:
+            height = plot_height * row[column] / top
+            if height:
+                y -= height
+                lines.append(svg_rect(x + 1, y, bar_width - 2, height,
+                    fill=color_by_category[category],
+                    title='{} {}: {}'.format(month, category, dollars(row[column]))))
+
+        if month_labeled(month, len_months=len(months)):
+            lines.append(svg_text(x + bar_width / 2, HEIGHT - MARGIN + 16, month, anchor='middle'))
+
+    lines.extend(svg_legend(spends, color_by_category))
+
+    return lines
+
+
+def svg_treemap(spends, color_by_category):
+    """Draw the spend of each category as a rectangle, its area in proportion to its cents"""
+
+    lines = []
+
+    boxes = squarify(
+        [cents for (cents, _, _,) in spends], x=0, y=0, width=WIDTH, height=HEIGHT)
+
+    for ((cents, category, _,), (x, y, width, height,),) in zip(spends, boxes):
+        title = '{}: {}'.format(category, dollars(cents))
+        lines.append(svg_rect(x, y, width, height,
+            fill=color_by_category[category], title=title, stroke='#ffffff'))
+        if (width > 80) and (height > 36):
+            lines.append(svg_text(x + 6, y + 16, category))
+            lines.append(svg_text(x + 6, y + 32, dollars(cents)))
+
+    return lines
+
+
+def svg_line(months, spends):
+    """Draw the sum of every month spent so far, as a line"""
+
+    totals = [sum(_) for _ in zip(*(row for (_, _, row,) in spends))] or [0] * len(months)
+    cumulatives = list(itertools.accumulate(totals))
+    (top, ticks,) = axis_ticks(max(cumulatives, default=0))
+
+    plot_width = WIDTH - 2 * MARGIN - LEGEND_WIDTH
+    plot_height = HEIGHT - 2 * MARGIN
+    step = plot_width / max(len(months), 1)
+
+    lines = svg_axes(ticks, top=top, plot_width=plot_width, plot_height=plot_height)
+
+    points = []
+    for (column, (month, cents,),) in enumerate(zip(months, cumulatives)):
+        x = MARGIN + (column + 0.5) * step
+        y = HEIGHT - MARGIN - plot_height * cents / top
+        points.append('{:.1f},{:.1f}'.format(x, y))
+
+        if month_labeled(month, len_months=len(months)):
+            lines.append(svg_text(x, HEIGHT - MARGIN + 16, month, anchor='middle'))
+
+    lines.append(
+        '<polyline points="{}" fill="none" stroke="{}" stroke-width="2"/>'.format(
+            ' '.join(points), COLORS[0]))
+
+    if cumulatives:
+        lines.append(svg_text(MARGIN + plot_width + 8, MARGIN + 16,
+            'spent {}'.format(dollars(cumulatives[-1]))))
+
+    return lines
+
+
+def axis_ticks(cents):
+    """Choose round ticks of dollars, from zero up past some cents"""
+
+    dollars_ = max(cents / 100, 1)
+
+    step = 1
+    while (step * 10) <= dollars_:
+        step *= 10
+    for multiple in (1, 2, 5, 10,):
+        if (dollars_ / (step * multiple)) <= 5:
+            step *= multiple
+            break
+
+    len_ticks = -int(-dollars_ // step)  # rounds up
+    ticks = [(_ * step * 100) for _ in range(len_ticks + 1)]
+
+    return (ticks[-1], ticks,)
+
+
+def month_labeled(month, len_months):
+    """Say to label a month, labeling each month of a short chart, else each January"""
+
+    labeled = (len_months <= 24) or month.endswith('-01')
+    return labeled
+
+
+def squarify(values, x, y, width, height):
+    """Lay out rectangles of areas in proportion to the values, as near to square as can be"""
+
+    values = list(values)
+    total = sum(values)
+    if not total:
+        return [(x, y, 0, 0,)] * len(values)
+
+    scale = (width * height) / total
+    areas = [(_ * scale) for _ in values]  # sorted largest first, by the caller
+
+    boxes = []
+    while areas:
+
+        # Fill rows along the shorter side, while adding the next area makes them more square
+
+        short = min(width, height)
+
+        row = [areas[0]]
+        for area in areas[1:]:
+            if worst_ratio(row + [area], short) > worst_ratio(row, short):
+                break
+            row.append(area)
+
+        areas = areas[len(row):]
+
+        # Lay out the row, then shrink the space left
+
+        thickness = sum(row) / short
+        offset = 0
+        for area in row:
+            length = area / thickness
+            if width >= height:
+                boxes.append((x, y + offset, thickness, length,))
+            else:
+                boxes.append((x + offset, y, length, thickness,))
+            offset += length
+
+        if width >= height:
+            x += thickness
+            width -= thickness
+        else:
+            y += thickness
+            height -= thickness
+
+    return boxes
+
+
+def worst_ratio(row, short):
+    """Find the worst aspect ratio of a row of areas laid along a side"""
+
+    sum_ = sum(row)
+    ratio = max(
+        max((short * short * _) / (sum_ * sum_), (sum_ * sum_) / (short * short * _))
+        for _ in row)
+
+    return ratio
+
+
+def svg_axes(ticks, top, plot_width, plot_height):
+    """Draw the gridlines of the ticks, labeled in dollars"""
+
+    lines = []
+    for tick in ticks:
+        y = HEIGHT - MARGIN - plot_height * tick / top
+        lines.append('<line x1="{}" y1="{:.1f}" x2="{}" y2="{:.1f}" stroke="#dddddd"/>'.format(
+            MARGIN, y, MARGIN + plot_width, y))
+        lines.append(svg_text(MARGIN - 6, y + 4, dollars(tick), anchor='end'))
+
+    return lines
+
+
+def svg_legend(spends, color_by_category):
+    """Name the color of each category, costliest first"""
+
+    lines = []
+
+    x = WIDTH - LEGEND_WIDTH
+    for (index, (_, category, _,),) in enumerate(spends):
+        y = MARGIN + index * 18
+        if y > (HEIGHT - MARGIN):
+            break
+
+        lines.append(svg_rect(x, y, 12, 12, fill=color_by_category[category]))
+        lines.append(svg_text(x + 18, y + 11, category))
+
+    return lines
+
+
+def svg_rect(x, y, width, height, fill, title=None, stroke=None):
+    """Draw a rectangle, with a tooltip, if titled"""
+
+    rect = '<rect x="{:.1f}" y="{:.1f}" width="{:.1f}" height="{:.1f}" fill="{}"'.format(
+        x, y, width, height, fill)
+    if stroke:
+        rect += ' stroke="{}"'.format(stroke)
+
+    if title is None:
+        rect += '/>'
+    else:
+        rect += '><title>{}</title></rect>'.format(xml.sax.saxutils.escape(title))
+
+    return rect
+
+
+def svg_text(x, y, chars, anchor='start'):
+    """Draw some text"""
+
+    text = '<text x="{:.1f}" y="{:.1f}" text-anchor="{}">{}</text>'.format(
+        x, y, anchor, xml.sax.saxutils.escape(chars))
+    return text
+
+
+def svg_dump(path, lines):
+    """Write one Svg chart"""
+
+    with open(path, 'w') as writing:
+        writing.write(
+            '<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}"'
+            ' font-family="sans-serif" font-size="12">\n'.format(WIDTH, HEIGHT))
+        writing.write('<rect width="100%" height="100%" fill="#ffffff"/>\n')
+        for line in lines:
+            writing.write(line + '\n')
+        writing.write('</svg>\n')
+
+
+def dollars(cents):
+    """Format cents as whole dollars, such as '$1,235'"""
+
+    dollars_ = '${:,.0f}'.format(cents / 100)
+    return dollars_
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -8,12 +8,28 @@ Work just enough to make some sense of many transactions of my statements
 
 
 import argparse
+import bisect
+import collections
+import contextlib
 import csv
 import datetime as dt
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
+import multiprocessing
 import os
 import re
 import sys
+import tempfile
 import textwrap
+import time
+import zlib
+
+import ledger
+import stages
+import store
 
 
 # Focus on pairs of lines tagged as Tj Tm, or as TJ Tm
@@ -23,79 +39,793 @@ import textwrap
 #   Accept interruption by an initial Header Row, and redundant Header Rows
 #
 
-LEADING_TJ_REGEX = r'^\([0-9][0-9][/][0-9][0-9]\)Tj$'
+LEADING_TJ_REGEX = re.compile(r'^\([0-9][0-9][/][0-9][0-9]\)Tj$', flags=re.MULTILINE)
 EXTRA_TJ_REGEX = r'^\(\$ Amount\)Tj$'
 
-PAIRED_TM_REGEX = r'^1 0 0 1 [0-9.]+ [0-9.]+ Tm$'
+DETAIL_TJ_REGEX = re.compile(r'^\(TRANSACTION DETAIL\)Tj$', flags=re.MULTILINE)
+SAVINGS_TJ_REGEX = re.compile(r'^\[\( CHASE SAVINGS\)\] TJ$', flags=re.MULTILINE)
+
+
+# Scan forward thru text of many lines at a time, to skip lines between transactions
+#
+#   Speak of each line of a transaction as one token of Pdf text operators
+#
+#   Tj as in "(...)Tj", with its string operand
+#   TJ as in "[(...)] TJ", with the string operand of its one-string array
+#   Tm as in "1 0 0 1 X Y Tm", with its X Y operands, else with no operands for other matrices
+#   else the last word of the line, as the operator, such as the "k" of "0 0 0 1 k"
+#
+
+LINES_PER_TEXT = 4096
+
+TOKEN_REGEX = re.compile(r'|'.join([
+    r'\((?P<Tj>.*)\)Tj',
+    r'\[\((?P<TJ>.*)\)\] TJ',
+    r'1 0 0 1 (?P<Tm>[0-9.]+ [0-9.]+) Tm',  # paired with a Tj, to move without transforming
+    r'.* (?P<operator>.*)',
+    r'(?P<other>.*)',
+]))
+
+
+# Trash the transactions of Total Checking that come with no amount, and no balance
+#
+#   Pick up the merchants and notes of the rest
+#
+
+SHORT_CHECKING_REGEX = re.compile('|'.join(textwrap.dedent(r"""
+    ATM Check Deposit
+    Card Purchase Return
+    Card Purchase W/Cash
+    Deposit
+    Interest Payment
+    Online Transfer From Chk
+    Online Transfer From Sav
+    Paypal
+    Purchase Return
+    Transfer From Chk
+    [A-Za-z0-9_ ]*Dir Dep
+    [A-Za-z0-9_ ]*Payment
+""").strip().splitlines()))
+
+DATED_NOTE_REGEX = re.compile(r'^(.*[0-9][0-9]/[0-9][0-9] )(.*)$')
+CARD_NOTE_REGEX = re.compile(r'^(.*) Card( [0-9]+)?$')
+LEADING_NOTE_REGEXES = (re.compile(r'^(Online Payment [0-9]+) '), re.compile(r'^(Online Transfer) '),)
+TRAILING_NOTE_REGEXES = (re.compile(r'( Transaction#: [0-9]+)$'),)
+
+
+PDF_TAGS = ('CREDIT CARD', 'TOTAL CHECKING',)
+
+
+# Scan for Pdf statements named as Chase names them, such as '20190102-statements-1234-.pdf',
+# inside a dir named as Chase names the account, such as 'CREDIT CARD (...1234)'
+#
+#   Scan each dir once, keeping only the names that match, never the names of every file
+#   Never scan inside hidden dirs, such as '.git', nor inside the partitions written here
+#
+
+STATEMENT_DIR_REGEX = re.compile(r'({}) \([.][.][.]([0-9]+)\)$'.format('|'.join(PDF_TAGS)))
+STATEMENT_FILE_REGEX = re.compile(r'^[0-9]+-statements-([0-9]+)-[.]pdf$')
+
+
+# Cache the rows of each Pdf, till the Pdf changes, or till the parser changes
+#
+#   Add 1 to the PARSER_VERSION to forget every Pdf parsed before, at any change of rows out
+#
+
+CACHE_PATH = 'chase-cache.json'
+CACHE_MAX_ROWS = 1000 * 1000
+
+PARSER_VERSION = 4
+
+
+# Sort the rows of each Pdf as a run, and merge the runs, to export rows from many Pdf's
+#
+#   Spill runs to disk, past a budget of rows held in memory
+#
+
+SORT_MAX_ROWS = 100 * 1000
+
+
+# Parse the Pdf's of each account apart, into a partition of rows sorted by date, then merge
+#
+#   Name each account by the dir holding its Pdf's, such as 'CREDIT CARD (...1234)'
+#   Reuse the partition of an account, till some Pdf of it changes, or the parser changes
+#
+
+PARTITIONS_DIR = 'chase-partitions'
+
+
+# Skip each Pdf found to hold the same bytes as a Pdf before it, and drop each duplicate row
+#
 
+DROPPED_PATH = 'chase-dropped-csv.csv'
 
-def main():
+
+# Inflate the Flate-compressed streams of a Pdf, one stream at a time, in chunks
+#
+#   Look back from each "stream" for "/FlateDecode" in the dictionary of its "obj"
+#   Look back only so far, and take a "stream" with no "obj" found there as not Flate
+#
+
+STREAM_REGEX = re.compile(rb'(?<!end)stream(\r\n|\n)')
+
+OBJ_LOOK_BACK = 4 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+
+# Force fit arbitrary bytes into US ASCII, one byte for one char, with '?' for unprintable bytes
+#
+
+PLAIN_ASCII_TABLE = bytes(
+    (_ if ((_ in b'\t\n\r') or (ord(' ') <= _ <= ord('~'))) else ord('?')) for _ in range(0x100))
+
+
+# Time each stage, and each Pdf, and write the times out as Json, if asked
+#
+
+STATS_PATH = 'chase-stats.json'
+
+
+def main(argv=None):
     """Convert to Csv Spreadsheet from Pdf Printout of Chase Bank Statements"""
 
+    batch = ledger.TransactionBatch()
+    batch.extend(stream(argv, csv_tap=True))
+
+    # Publish Transactions, to let Mark Py take them without parsing the Csv
+
+    return batch
+
+
+def stream(argv=None, csv_tap=False):
+    """Yield the Transactions of Pdf Printouts of Chase Bank Statements, sorted by date"""
+
     main.trace = argparse.Namespace()
     when_launched = dt.datetime.now()
 
-    # Export to Csv
+    parser = chase_compile_argdoc()
+    args = parser.parse_args(argv[1:] if argv else [])
+
+    clock = stages.StageClock()
+
+    # Export to Csv, if asked
+
+    csv_writer = None
+    if csv_tap:
+        csv_writer = csv.writer(open('chase-export-csv.csv', 'w'))
+        #csv_writer = csv.writer(sys.stdout)
+
+    # Find the Pdf statements inside a Dir of Dir's downloaded from Chase Bank, as scanned,
+    # and skip each Pdf of the same bytes as a Pdf before it, in any account
 
-    csv_writer = csv.writer(open('chase-export-csv.csv', 'w'))
-    #csv_writer = csv.writer(sys.stdout)
+    cache = None
+    if not args.no_cache:
+        cache = ParseCache(CACHE_PATH, max_rows=args.cache_max_rows)
+        with clock.stage('cache'):
+            cache.load()
 
-    # Find Pdf's inside a Dir of Dir's downloaded from Chase Bank
+    dedup = None if args.keep_duplicates else Dedup()
 
     filepaths = []
-    for step in os.walk('.'):
-        (dirpath, dirnames, filenames,) = step
+    for filepath in clock.timed('walk', scan_statements('.')):
+        if dedup:
+            with clock.stage('dedup'):
+                if dedup.skip_filepath(filepath, cache=cache):
+                    continue
 
-        dirnames.sort()
-        filenames.sort()
+        filepaths.append(filepath)
 
-        for filename in filenames:
-            if filename.endswith('.pdf'):
-                filepath = os.path.join(dirpath, filename)
+    # Parse, dedup, and sort the Pdf's of each account into a partition of its own,
+    # reusing the partition of each account whose Pdf's didn't change, else in parallel if asked
 
-                filepaths.append(filepath)
+    (partitions, drops,) = partition_filepaths(
+        filepaths, cache=cache, clock=clock, processes=args.jobs,
+        sort_max_rows=args.sort_max_rows, keep_duplicates=args.keep_duplicates)
 
-    # Collect Transactions from each Pdf
+    if cache:
+        with clock.stage('cache'):
+            cache.dump()
 
-    main.sortables = []
-    for filepath in filepaths:
-        dirpath = os.path.dirname(filepath)
+    if dedup:
+        dedup.drops = drops
 
-        chars = plain_ascii_str(open(filepath, 'rb').read())
-        lines = chars.split('\n')  # more like 'vi' than chars.splitlines()
+        dedup.dump(DROPPED_PATH)
+        clock.count('duplicate_pdfs', delta=len(dedup.skips))
+        clock.count('duplicate_transactions', delta=len(dedup.drops))
 
-        main.trace.filepath = filepath
-        main.trace.lines = lines
+    # Yield Transactions while merging the sorted runs of each Pdf, and export them as asked
 
-        for pdf_tag in ('CREDIT CARD', 'TOTAL CHECKING',):
-            if pdf_tag in dirpath:  # wart: else trash silently
-               pdf_parse(pdf_tag, filepath=filepath, lines=lines)
+    if csv_writer:
+        header = ('', 'Yyyy-mm-dd', 'Amount', 'Merchant', 'Notes',)
+        csv_writer.writerow(header)
+
+    batch = ledger.TransactionBatch() if (args.ledger or args.store) else None
+
+    len_transactions = 0
+
+    merged = merge_partitions(partitions, filepaths=filepaths)
+    for transaction in clock.timed('sort', merged):
+        len_transactions += 1
 
-    # Sort Transactions
+        with clock.stage('csv_write'):
+            if csv_writer:
+                csv_writer.writerow(transaction.to_row())
+            if batch is not None:
+                batch.append(transaction)
 
-    sortables = list(main.sortables)
-    sortables.sort()
+        with clock.stage('consumer'):
+            yield transaction
 
-    rows = [s[-1] for s in sortables]
+    clock.count('transactions', delta=len_transactions)
 
-    # Export Transactions, after one Header Row
+    if args.ledger:
+        with clock.stage('ledger_write'):
+            ledger.ledger_dump(ledger.LEDGER_PATH, batch=batch)
 
-    header = ('', 'Yyyy-mm-dd', 'Amount', 'Merchant', 'Notes',)
-    csv_writer.writerow(header)
-    csv_writer.writerows(rows)
+    if args.store:
+        with clock.stage('store_write'):
+            store.store_load(store.STORE_PATH, transactions=batch)
 
     # Count the cost of run time
 
     when_quit = dt.datetime.now()
+    if dedup and (dedup.skips or dedup.drops):
+        print('Chase Py skipped {} duplicate Pdf\'s, and dropped {} duplicate rows, into {!r}'
+            .format(len(dedup.skips), len(dedup.drops), DROPPED_PATH))
     print('Chase Py ran inside', when_quit - when_launched)
 
+    if stages.stats_wanted(args.stats):
+        stages.stats_dump(STATS_PATH, clock=clock, program='chase')
+
+
+def chase_compile_argdoc():
+    """Construct the helplines for a parser, and the parser itself, to parse a command line"""
+
+    parser = argparse.ArgumentParser(
+        prog='chase',
+        formatter_class=argparse.RawTextHelpFormatter,
+        )
+
+    parser.add_argument('-j', '--jobs', metavar='N', type=int, default=1,
+        help='parse as many as N Pdf\'s at a time (default: 1, or 0 for one per cpu)')
+    parser.add_argument('--no-cache', action='store_true',
+        help='parse every Pdf again, without reading or writing {!r}'.format(CACHE_PATH))
+    parser.add_argument('--sort-max-rows', metavar='N', type=int, default=SORT_MAX_ROWS,
+        help='spill sorted runs to disk past N rows held in memory (default: {})'.format(
+            SORT_MAX_ROWS))
+    parser.add_argument('--cache-max-rows', metavar='N', type=int, default=CACHE_MAX_ROWS,
+        help='forget the least recently used Pdf\'s past N rows (default: {})'.format(
+            CACHE_MAX_ROWS))
+    parser.add_argument('--keep-duplicates', action='store_true',
+        help='parse Pdf\'s of the same bytes again, and keep rows found again')
+    parser.add_argument('--ledger', action='store_true',
+        help='also write {!r}, for Mark Py to read without parsing'.format(ledger.LEDGER_PATH))
+    parser.add_argument('--store', action='store_true',
+        help='also load {!r}, for Store Py to query'.format(store.STORE_PATH))
+    parser.add_argument('--stats', action='store_true',
+        help='write the time of each stage and each Pdf to {!r} (or set {}=1)'.format(
+            STATS_PATH, stages.STATS_ENV))
+
+    return parser
+
+
+class Dedup(object):
+    """Skip Pdf's of the same bytes, and drop rows found again, and say what was dropped"""
+
+    def __init__(self):
+
+        self.filepath_by_digest = dict()  # the first Pdf of each digest
+        self.keys = set()  # (account, day, cents, merchant, rank,) of each row kept
+
+        self.skips = []  # (filepath, first filepath,) of each Pdf skipped
+        self.drops = []  # (filepath, transaction,) of each row dropped
+
+    def skip_filepath(self, filepath, cache):
+        """Say to skip a Pdf, if it holds the same bytes as a Pdf before it"""
+
+        if cache:
+            digest = cache.digest(filepath)
+        else:
+            with mapped_bytes(filepath) as bytes_:
+                digest = hashlib.sha256(bytes_).hexdigest()
+
+        first_filepath = self.filepath_by_digest.setdefault(digest, filepath)
+        if first_filepath == filepath:
+            return False
+
+        self.skips.append((filepath, first_filepath,))
+        return True
+
+    def drop_duplicates(self, filepath, transactions):
+        """Keep each row not kept before, counting repeats inside one Pdf as distinct rows"""
+
+        rank_by_key = collections.Counter()
+
+        kept = []
+        for transaction in transactions:
+            key = (
+                transaction.account, transaction.ordinal, transaction.cents, transaction.merchant,)
+
+            rank_by_key[key] += 1  # to keep 2 same coffees on 1 day, as found in 1 Pdf
+            ranked_key = key + (rank_by_key[key],)
+
+            if ranked_key in self.keys:
+                self.drops.append((filepath, transaction,))
+            else:
+                self.keys.add(ranked_key)
+                kept.append(transaction)
+
+        return kept
+
+    def dump(self, path):
+        """Write the Pdf's skipped and the rows dropped, as a Csv table"""
+
+        csv_writer = csv.writer(open(path, 'w'))
+
+        if self.skips or self.drops:
+            csv_writer.writerow(('', 'Yyyy-mm-dd', 'Amount', 'Merchant', 'Notes', 'Why', 'Pdf',))
+
+        for (filepath, first_filepath,) in self.skips:
+            why = 'same bytes as {}'.format(first_filepath)
+            csv_writer.writerow(('', '', '', '', '', why, filepath,))
+
+        for (filepath, transaction,) in self.drops:
+            csv_writer.writerow(transaction.to_row() + ('row found before', filepath,))
+
+
+class SortedRuns(object):
+    """Sort Transactions by date, by merging sorted runs, spilling runs to disk past a budget"""
+
+    def __init__(self, max_rows):
+
+        self.max_rows = max_rows
+
+        self.runs = []  # sorted runs held in memory
+        self.len_run_rows = 0  # count of rows held in memory
+        self.spills = []  # sorted runs spilled to disk
+
+        self.len_rows = 0  # count of rows added, to sort stably
+
+    def add_transactions(self, transactions):
+        """Add the Transactions of one Pdf, as one sorted run"""
+
+        run = []
+        for transaction in transactions:
+
+            key = (transaction.ordinal, self.len_rows,)  # wart: cleverly stable sort
+            sortable = (key, transaction,)
+            run.append(sortable)
+
+            self.len_rows += 1
+
+        run.sort()  # quick, as each Pdf comes nearly sorted
+
+        self.runs.append(run)
+        self.len_run_rows += len(run)
+
+        if self.len_run_rows > self.max_rows:
+            self.spill_runs()
+
+    def spill_runs(self):
+        """Merge the runs held in memory into one run on disk"""
+
+        spill = tempfile.TemporaryFile('w+', newline='')
+        csv_writer = csv.writer(spill)
+
+        for ((_, index,), transaction,) in heapq.merge(*self.runs):
+            csv_writer.writerow((index,) + transaction.fields())
+
+        spill.seek(0)
+        self.spills.append(spill)
+
+        self.runs = []
+        self.len_run_rows = 0
+
+    def merge(self):
+        """Yield every sortable added, in order, by merging each run"""
+
+        spilled_runs = [self.read_spill(_) for _ in self.spills]
+        yield from heapq.merge(*spilled_runs, *self.runs)
+
+    def read_spill(self, spill):
+        """Yield the sortables of a run spilled to disk, then close it"""
+
+        with spill:
+            for fields in csv.reader(spill):
+                (index, ordinal, cents, merchant, notes, account,) = fields
+
+                key = (int(ordinal), int(index),)
+                transaction = ledger.Transaction(
+                    int(ordinal), cents=int(cents), merchant=merchant, notes=notes, account=account)
+
+                yield (key, transaction,)
+
+
+def scan_statements(dirpath):
+    """Yield each Pdf statement, as soon as found, in the order of 'os.walk' with sorted names"""
+
+    try:
+        with os.scandir(dirpath) as entries:
+            dir_matched = STATEMENT_DIR_REGEX.search(os.path.basename(dirpath))
+
+            filepaths = []
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        if entry.name != PARTITIONS_DIR:
+                            subdirs.append(entry.path)
+                elif dir_matched:
+                    file_matched = STATEMENT_FILE_REGEX.match(entry.name)
+                    if file_matched and (file_matched.group(1) == dir_matched.group(2)):
+                        filepaths.append(entry.path)
+    except OSError:
+        return  # as 'os.walk' skips dirs it can't list
+
+    filepaths.sort()
+    yield from filepaths
+
+    subdirs.sort()
+    for subdir in subdirs:
+        yield from scan_statements(subdir)
+
+
+def filepaths_by_account(filepaths):
+    """Group the Pdf's by the dir holding them, keeping the order of the Pdf's in each"""
+
+    filepaths_by_name = collections.OrderedDict()
+    for filepath in filepaths:
+        name = os.path.basename(os.path.dirname(filepath)) or os.path.basename(os.getcwd())
+        filepaths_by_name.setdefault(name, []).append(filepath)
+
+    return filepaths_by_name
+
+
+class Partition(object):
+    """Keep the rows of one account on disk, sorted by date, with a manifest of its Pdf's"""
+
+    def __init__(self, dirpath, name, filepaths, keep_duplicates):
+
+        self.name = name
+        self.csv_path = os.path.join(dirpath, '{}-csv.csv'.format(name))
+        self.json_path = os.path.join(dirpath, '{}.json'.format(name))
+
+        self.filepaths = filepaths
+        self.keep_duplicates = keep_duplicates
+
+        self.files = []  # (filepath, size, mtime_ns,) of each Pdf, as when listed
+        for filepath in filepaths:
+            stat = os.stat(filepath)
+            self.files.append([filepath, stat.st_size, stat.st_mtime_ns])
+
+        self.drops = None  # (file index, fields,) of each row dropped, once read or parsed
+
+    def manifest(self):
+        """Form the Json that says which Pdf's, unchanged, by which parser, filled the partition"""
+
+        manifest = dict(
+            version=PARSER_VERSION, keep_duplicates=self.keep_duplicates, files=self.files)
+        return manifest
+
+    def fresh(self):
+        """Say if the partition on disk came from these Pdf's, unchanged, by this parser"""
+
+        try:
+            with open(self.json_path) as reading:
+                whole = json.load(reading)
+        except (OSError, ValueError):
+            return False
+
+        drops = whole.pop('drops', None)
+        if whole != self.manifest():
+            return False
+        if not os.path.exists(self.csv_path):
+            return False
+
+        self.drops = drops
+        return True
+
+    def dump(self, sortables, file_lens, drops):
+        """Write the rows sorted, then the manifest, never leaving a stale manifest in place"""
+
+        os.makedirs(os.path.dirname(self.json_path), exist_ok=True)
+        if os.path.exists(self.json_path):
+            os.remove(self.json_path)
+
+        file_starts = list(itertools.accumulate(file_lens, initial=0))
+
+        with open(self.csv_path, 'w', newline='') as writing:
+            csv_writer = csv.writer(writing)
+            for ((_, index,), transaction,) in sortables:
+                file_index = bisect.bisect_right(file_starts, index) - 1
+                csv_writer.writerow((file_index,) + transaction.fields())
+
+        self.drops = drops
+
+        whole = dict(self.manifest(), drops=drops)
+
+        tmp_path = self.json_path + '.tmp'
+        with open(tmp_path, 'w') as writing:
+            json.dump(whole, writing)
+        os.replace(tmp_path, self.json_path)
+
+    def read(self, rank_by_filepath):
+        """Yield the sortables of the partition, keyed to merge with the other partitions"""
+
+        ranks = [rank_by_filepath[_] for _ in self.filepaths]
+
+        with open(self.csv_path, newline='') as reading:
+            for (position, fields,) in enumerate(csv.reader(reading)):
+                (file_index, ordinal, cents, merchant, notes, account,) = fields
+
+                ordinal = int(ordinal)
+                key = (ordinal, ranks[int(file_index)], position,)
+                transaction = ledger.Transaction(
+                    ordinal, cents=int(cents), merchant=merchant, notes=notes, account=account)
+
+                yield (key, transaction,)
 
-def pdf_parse(pdf_tag, filepath, lines):
+
+def partition_filepaths(filepaths, cache, clock, processes, sort_max_rows, keep_duplicates):
+    """Parse, dedup, and sort the Pdf's of each account into its partition, as Pdf's changed
+
+    Return the partitions, and the (filepath, transaction,) of each row dropped, in the order
+    of the Pdf's, after skipping Pdf's of the same bytes, as the caller should, in any account
+    """
+
+    # Reuse each partition whose Pdf's didn't change, else list the Pdf's to parse again
+
+    partitions = []
+    jobs = []  # (partition, cached Transactions by filepath,) of each partition to write again
+    with clock.stage('partition'):
+        for (name, account_filepaths,) in filepaths_by_account(filepaths).items():
+            partition = Partition(
+                PARTITIONS_DIR, name=name, filepaths=account_filepaths,
+                keep_duplicates=keep_duplicates)
+            partitions.append(partition)
+
+            if cache and partition.fresh():
+                for filepath in account_filepaths:
+                    cache.touch(filepath)
+                clock.count('partitions_reused')
+                continue
+
+            transactions_by_filepath = dict()
+            if cache:
+                with clock.stage('cache'):
+                    for filepath in account_filepaths:
+                        transactions = cache.lookup(filepath)
+                        if transactions is not None:
+                            transactions_by_filepath[filepath] = transactions
+
+            jobs.append((partition, transactions_by_filepath,))
+
+    misses = [
+        filepath for (partition, transactions_by_filepath,) in jobs
+        for filepath in partition.filepaths if filepath not in transactions_by_filepath]
+
+    # Parse each Pdf not cached, in parallel if asked, then dedup and sort each account
+
+    pooling = contextlib.nullcontext()  # as None
+    if (processes != 1) and (len(misses) > 1):
+        pooling = multiprocessing.Pool(min(processes or os.cpu_count(), len(misses)))
+
+    drops_by_name = dict((_.name, _.drops,) for _ in partitions if _.drops is not None)
+    with pooling as pool:  # terminates the workers, even when some Pdf fails to parse
+
+        if pool:
+            parsed = pool.imap(pdf_parse_filepath, misses)  # in order, not as finished
+        else:
+            parsed = map(pdf_parse_filepath, misses)
+
+        parsed = clock.timed('pdfs', parsed)
+        for (partition, transactions_by_filepath,) in jobs:
+
+            for filepath in partition.filepaths:
+                transactions = transactions_by_filepath.get(filepath)
+                if transactions is not None:
+                    file_json = dict(stages=dict(), counts=dict(rows_cached=len(transactions)))
+                    clock.add_file(filepath, file_json=file_json, cached=True)
+                else:
+                    (transactions, file_json,) = next(parsed)
+                    transactions_by_filepath[filepath] = transactions
+                    clock.add_file(filepath, file_json=file_json, cached=False)
+                    if cache:
+                        with clock.stage('cache'):
+                            cache.store(filepath, transactions=transactions)
+
+            with clock.stage('partition'):
+                drops_by_name[partition.name] = account_pipeline(
+                    partition, transactions_by_filepath=transactions_by_filepath,
+                    sort_max_rows=sort_max_rows)
+
+    rank_by_filepath = dict((f, rank,) for (rank, f,) in enumerate(filepaths))
+
+    sortables = []
+    for partition in partitions:
+        for (file_index, fields,) in drops_by_name[partition.name]:
+            filepath = partition.filepaths[file_index]
+            key = (rank_by_filepath[filepath], len(sortables),)
+            sortables.append((key, filepath, ledger.Transaction(*fields),))
+
+    drops = [_[1:] for _ in sorted(sortables)]  # in the order of the Pdf's
+
+    return (partitions, drops,)
+
+
+def account_pipeline(partition, transactions_by_filepath, sort_max_rows):
+    """Dedup and sort the Transactions of the Pdf's of one account, into its partition"""
+
+    dedup = None if partition.keep_duplicates else Dedup()
+    runs = SortedRuns(max_rows=sort_max_rows)
+
+    file_lens = []
+    for filepath in partition.filepaths:
+        transactions = transactions_by_filepath[filepath]
+        if dedup:
+            transactions = dedup.drop_duplicates(filepath, transactions=transactions)
+
+        runs.add_transactions(transactions)
+        file_lens.append(len(transactions))
+
+    file_index_by_filepath = dict((f, index,) for (index, f,) in enumerate(partition.filepaths))
+    drops = []
+    if dedup:
+        drops = [(file_index_by_filepath[f], t.fields(),) for (f, t,) in dedup.drops]
+
+    partition.dump(runs.merge(), file_lens=file_lens, drops=drops)
+
+    return drops
+
+
+def merge_partitions(partitions, filepaths):
+    """Yield the Transactions of every partition, sorted by date, then by Pdf, then as found"""
+
+    rank_by_filepath = dict((f, rank,) for (rank, f,) in enumerate(filepaths))
+
+    reads = [_.read(rank_by_filepath) for _ in partitions]
+    for (_, transaction,) in heapq.merge(*reads):
+        yield transaction
+
+
+def pdf_parse_filepath(filepath):
+    """Collect the Transactions of one Pdf, and the Json of its clock, with no help from globals"""
+
+    dirpath = os.path.dirname(filepath)
+
+    main.trace = argparse.Namespace(filepath=filepath)
+        # wart: traced only inside the process that parsed
+
+    clock = stages.StageClock()
+
+    transactions = []
+    with mapped_bytes(filepath) as bytes_:
+        for pdf_tag in PDF_TAGS:
+            if pdf_tag in dirpath:  # wart: else trash silently
+                texts = pdf_texts(bytes_, clock=clock)
+                with clock.stage('parse'):
+                    transactions.extend(
+                        pdf_parse(pdf_tag, filepath=filepath, texts=texts, clock=clock))
+
+    return (transactions, clock.to_json(),)
+
+
+class ParseCache(object):
+    """Remember the Transactions of each Pdf, till the Pdf changes or the parser changes"""
+
+    def __init__(self, path, max_rows):
+
+        self.path = path
+        self.max_rows = max_rows
+
+        self.entries = dict()  # by filepath
+        self.digests = dict()  # by filepath, for Pdf's read but not yet stored
+        self.when_used = int(time.time())
+
+    def load(self):
+        """Read the cache from disk, else start over empty"""
+
+        try:
+            with open(self.path) as reading:
+                whole = json.load(reading)
+        except (OSError, ValueError):
+            return
+
+        if whole.get('version') == PARSER_VERSION:
+            self.entries = whole['entries']
+
+    def dump(self):
+        """Write the cache to disk, after forgetting the least recently used Pdf's past the cap"""
+
+        entries = self.entries
+
+        len_rows = sum(len(_['rows']) for _ in entries.values())
+        for filepath in sorted(entries.keys(), key=lambda _: entries[_]['used']):
+            if len_rows <= self.max_rows:
+                break
+            len_rows -= len(entries[filepath]['rows'])
+            del entries[filepath]
+
+        whole = dict(version=PARSER_VERSION, entries=entries)
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as writing:
+            json.dump(whole, writing)
+        os.replace(tmp_path, self.path)
+
+    def digest(self, filepath):
+        """Return the digest of a Pdf, as remembered if unchanged, else as read again"""
+
+        stat = os.stat(filepath)
+
+        entry = self.entries.get(filepath)
+        if entry:
+            if (entry['size'], entry['mtime_ns'],) == (stat.st_size, stat.st_mtime_ns,):
+                return entry['sha256']
+
+        if filepath in self.digests:
+            (stat_, digest,) = self.digests[filepath]
+            if (stat_.st_size, stat_.st_mtime_ns,) == (stat.st_size, stat.st_mtime_ns,):
+                return digest
+
+        with mapped_bytes(filepath) as bytes_:
+            digest = hashlib.sha256(bytes_).hexdigest()
+
+        self.digests[filepath] = (stat, digest,)
+
+        return digest
+
+    def lookup(self, filepath):
+        """Return the Transactions of a Pdf found unchanged since last parsed, else None"""
+
+        stat = os.stat(filepath)
+
+        entry = self.entries.get(filepath)
+        if entry:
+            if (entry['size'], entry['mtime_ns'],) == (stat.st_size, stat.st_mtime_ns,):
+                entry['used'] = self.when_used
+                transactions = [ledger.Transaction(*_) for _ in entry['rows']]
+                return transactions
+
+        digest = self.digest(filepath)
+
+        if entry and (entry['sha256'] == digest):  # touched, but not changed
+            entry['used'] = self.when_used
+            entry['size'] = stat.st_size
+            entry['mtime_ns'] = stat.st_mtime_ns
+            transactions = [ledger.Transaction(*_) for _ in entry['rows']]
+            return transactions
+
+        return None
+
+    def touch(self, filepath):
+        """Count a Pdf as used, as if looked up, to keep it past the cap"""
+
+        entry = self.entries.get(filepath)
+        if entry:
+            entry['used'] = self.when_used
+
+    def store(self, filepath, transactions):
+        """Remember the Transactions of a Pdf, as parsed after a lookup missed"""
+
+        rows = [_.fields() for _ in transactions]
+
+        (stat, digest,) = self.digests.pop(filepath)
+
+        entry = dict(
+            size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=digest,
+            used=self.when_used, rows=rows)
+
+        self.entries[filepath] = entry
+
+
+def pdf_parse(pdf_tag, filepath, texts, clock=None):
     """Convert from Pdf Printout of Credit Card Statement from Chase Bank"""
 
     # Work up guesses from the Pdf filename
 
-    tail = filepath[filepath.index(pdf_tag):]
+    tail = filepath[filepath.rindex(pdf_tag):]  # the innermost dir, if nested
     pattern = r'^{} \([.][.][.]([0-9]+)\)/([0-9]+)-statements-([0-9]+)-.pdf$'.format(pdf_tag)
     matched = re.match(pattern, string=tail)
 
@@ -117,19 +847,16 @@ def pdf_parse(pdf_tag, filepath, lines):
         ym1 = dt.datetime(year=ym1.year, month=ym1.month, day=1)
         ym1 = (ym1 - dt.timedelta(days=28))  # wart: '28' means 1 month ago
 
-    # Publish guesses
-
-    pdf_parse.str_account = str_account
-    pdf_parse.year_by_month = year_by_month
-
     # Divide the Pdf into Streams
 
-    whole = LineTaker(lines)
+    clock = clock or stages.StageClock()
+    whole = LineTaker(texts, str_account=str_account, year_by_month=year_by_month, clock=clock)
+    pdf_parse.whole = whole  # wart: traced only inside the process that parsed
     assert whole
 
     if pdf_tag == 'TOTAL CHECKING':
-        whole.trash_lines_beyond_regex(r'^\[\( CHASE SAVINGS\)\] TJ$')
-        whole.skip_lines_till_regex(r'^\(TRANSACTION DETAIL\)Tj$')
+        whole.trash_lines_beyond_regex(SAVINGS_TJ_REGEX)
+        whole.skip_lines_till_regex(DETAIL_TJ_REGEX)
             # to skip hits of LEADING_TJ_REGEX in rows of Check Number, Date Paid, Amount
 
     while whole:
@@ -137,59 +864,152 @@ def pdf_parse(pdf_tag, filepath, lines):
         if whole:
             whole.collect_transaction_lines(pdf_tag)
 
+    # Publish the Transactions collected, in the order found
+
+    clock.count('lines', delta=whole.len_taken)
+    clock.count('rows_parsed', delta=len(whole.transactions))
+
+    return whole.transactions
+
 
 class LineTaker(object):
-    """Walk thru the lines of a file"""
+    """Walk thru the lines of a file, reading lazily, forgetting the lines taken"""
+
+    def __init__(self, texts, str_account, year_by_month, clock):
+
+        self.text = ''  # text of lines read, but not yet forgotten, each line ending with '\n'
+        self.reader = iter(texts)  # texts not yet read
+        self.eof = False
+
+        self.pos = 0  # index of the first char of the next untaken line
+        self.len_taken = 0  # count of lines taken
+        self.trash_regex = None  # regex to match, to trash all lines beyond it
+
+        self.str_account = str_account  # guessed from the Pdf filename
+        self.year_by_month = year_by_month
 
-    def __init__(self, lines):
+        self.transactions = []  # Transactions collected from this Pdf only
+        self.clock = clock  # to count things seen
 
-        self.lines = lines
-        self.len_takeable_lines = len(lines)
+    def __bool__(self):
 
-    def __len__(self):
+        while self.pos >= len(self.text):
+            if not self.read_text():
+                return False
 
-        len_ = len(self.lines)
-        return len_
+        return True
 
     def lineno(self):
         """Calculate line number of next untaken line"""
 
-        lineno = (self.len_takeable_lines - len(self.lines) + 1)
+        lineno = (self.len_taken + 1)
         return lineno
 
+    def read_text(self):
+        """Read the text of more lines, and forget the lines taken, else return False at Eof"""
+
+        if self.eof:
+            return False
+
+        text = next(self.reader, None)
+        if text is None:
+            self.eof = True
+            assert not self.trash_regex  # trash regex never matched
+            return False
+
+        if self.trash_regex:
+            matched = self.trash_regex.search(text)
+            if matched:
+                text = text[:matched.start()]
+                self.eof = True
+                self.trash_regex = None
+
+        self.text = self.text[self.pos:] + text
+        self.pos = 0
+
+        return True
+
+    def peek_tokens(self, len_lines):
+        """Speak of a few of the next untaken lines as tokens, without taking them"""
+
+        stop = self.read_thru_lines(len_lines)
+
+        lines = self.text[self.pos:stop].split('\n')[:-1]
+        tokens = [pdf_token(_) for _ in lines]
+
+        return tokens
+
+    def read_thru_lines(self, len_lines):
+        """Read thru a few untaken lines, and find the index beyond them, else the index of Eof"""
+
+        while True:
+            text = self.text
+
+            stop = self.pos
+            for _ in range(len_lines):
+                index = text.find('\n', stop)
+                if index < 0:
+                    break
+                stop = (index + 1)
+            else:
+                return stop
+
+            if not self.read_text():
+                return len(self.text)
+
+    def take_lines(self, len_lines):
+        """Take a few lines, else thru Eof"""
+
+        self.take_thru_index(self.read_thru_lines(len_lines))
+
+    def take_thru_index(self, index):
+        """Take lines up to an index"""
+
+        self.len_taken += self.text.count('\n', self.pos, index)
+        self.pos = index
+
     def skip_lines_till_transaction(self):
         """Skip lines up to next transaction, else thru Eof"""
 
-        len_skippable = len(self.lines)
+        lineno = self.lineno()
         self.skip_lines_till_regex(LEADING_TJ_REGEX)
-        len_skipped = (len_skippable - len(self.lines))
+        len_skipped = (self.lineno() - lineno)
 
         max_skipped = 1000  # seen 807, 319, 254, 150, 106, 85
-        if len(self.lines) == self.len_takeable_lines:
+        if lineno == 1:
             max_skipped = 1500  # seen 807 up front
-        elif not self.lines:
+        elif not self:
             max_skipped = 4500  # seen 3090 out back
 
         assert len_skipped <= max_skipped
 
+        self.clock.count('lines_skipped', delta=len_skipped)
+        if self:
+            self.clock.count('leading_tj_matches')
+
     def skip_lines_till_regex(self, regex):
         """Skip lines up to next match of regex, else thru Eof"""
 
-        lines = self.lines
-        while lines and not re.match(regex, string=lines[0]):
-            lines = lines[1:]
+        while True:
+            matched = regex.search(self.text, self.pos)
+            if matched:
+                self.take_thru_index(matched.start())
+                break
 
-        self.lines = lines
+            self.take_thru_index(len(self.text))
+            if not self.read_text():
+                break
 
     def trash_lines_beyond_regex(self, regex):
-        """Trash lines beyond next match of regex"""
+        """Trash lines beyond next match of regex, else raise AssertionError at Eof"""
 
-        lines = self.lines
-        while lines and not re.match(regex, string=lines[0]):
-            lines = lines[1:]
+        matched = regex.search(self.text, self.pos)
+        if matched:
+            self.text = self.text[:matched.start()]
+            self.eof = True
+            return
 
-        assert lines
-        self.lines = self.lines[:-len(lines)]
+        self.trash_regex = regex  # to match while reading, not all up front
 
     def collect_transaction_lines(self, pdf_tag):
         if pdf_tag == 'CREDIT CARD':
@@ -201,49 +1021,38 @@ class LineTaker(object):
     def collect_total_checking_lines(self):
         """Take the lines of a Total Checking  Transaction, and collect them"""
 
-        lines = self.lines
-        assert re.match(LEADING_TJ_REGEX, string=lines[0])
+        len_transaction_lines = 10
+        tokens = self.peek_tokens(len_transaction_lines)
+        assert LEADING_TJ_REGEX.match(tokens[0].line)
 
         # Require Tj-Tm pairs
 
-        len_transaction_lines = 10
-        copies = list(lines[:len_transaction_lines])
+        copies = list(tokens[:len_transaction_lines])
 
         """
         if len(copies) < len_transaction_lines:  # wart: lines from Savings land a lil above it
-            if copies[2] == '(Interest Payment)Tj':
-                self.lines = []
+            if (copies[2].kind, copies[2].operand,) == ('Tj', 'Interest Payment'):
+                self.skip_lines_till_regex(re.compile(r'(?!)'))  # thru Eof
                 return
         """
 
-        regexes = textwrap.dedent(r"""
-            ^\(ATM Check Deposit
-            ^\(Card Purchase Return
-            ^\(Card Purchase W/Cash
-            ^\(Deposit
-            ^\(Interest Payment
-            ^\(Online Transfer From Chk
-            ^\(Online Transfer From Sav
-            ^\(Paypal
-            ^\(Purchase Return
-            ^\(Transfer From Chk
-            ^\([A-Za-z0-9_ ]*Dir Dep
-            ^\([A-Za-z0-9_ ]*Payment
-        """).strip().splitlines()
-
-        for regex in regexes:
-            if re.match(regex, string=copies[2]):  # wart: amount lost
+        if copies[2].kind == 'Tj':
+            if SHORT_CHECKING_REGEX.match(copies[2].operand):  # wart: amount lost
+                self.clock.count('short_checking_matches')
                 len_transaction_lines = 6
-                self.lines = self.lines[len_transaction_lines:]
+                self.take_lines(len_transaction_lines)
                 return
 
-        if copies[6] == '(-)Tj':  # wart: Card Purchase just sometimes adds a line
+        if (copies[6].kind, copies[6].operand,) == ('Tj', '-'):
+            # wart: Card Purchase just sometimes adds a line
+            tokens = self.peek_tokens(12)
             for index in range(4, 10):
-                copies[index] = lines[2 + index]
+                copies[index] = tokens[2 + index]
             len_transaction_lines += 2
 
         for index in range(1, len(copies), 2):
-            assert re.match(PAIRED_TM_REGEX, string=copies[index])
+            assert copies[index].kind == 'Tm'
+            assert copies[index].operand
 
         date_of = pick_from_tj(copies[0])
         merchant = pick_from_tj(copies[2])
@@ -253,8 +1062,8 @@ class LineTaker(object):
 
         assert '"' not in merchant
         assert minus == '-'
-        assert re.match(r'^[0-9.,]+$', string=amount)
-        assert re.match(r'^[0-9.,]+$', string=balance)
+        cents = ledger.cents_from_amount(amount, signed=False)  # else raise ValueError
+        ledger.cents_from_amount(balance, signed=False)
 
         # Guess Year-Month-Day from Chase "Date of"  # wart: great pile of copy-edited sourcelines
 
@@ -263,26 +1072,25 @@ class LineTaker(object):
         month = int(splits[0])
         day = int(splits[1])
 
-        year = pdf_parse.year_by_month[month]
+        year = self.year_by_month[month]
 
-        ymd = '{}-{:02}-{:02}'.format(year, month, day)
-        assert len(ymd) == len('1999-12-31')
+        ordinal = dt.date(year, month, day).toordinal()
 
         # Work up some notes of details
 
         notes = []
 
-        notes.append('{}-account'.format(pdf_parse.str_account))
+        notes.append('{}-account'.format(self.str_account))
             # WART: difficult to write leading zeroes into Csv
 
-        matched = re.match(r'^(.*[0-9][0-9]/[0-9][0-9] )(.*)$', string=merchant)
+        matched = DATED_NOTE_REGEX.match(merchant)
         if not matched:
             split_merchant = ' '.join(merchant.split())
         else:
             split_note = matched.group(1).strip()
             split_merchant = matched.group(2).strip()
 
-            matched = re.match(r'^(.*) Card( [0-9]+)?$', string=split_merchant)
+            matched = CARD_NOTE_REGEX.match(split_merchant)
             if not matched:
                 notes.append(split_note)
             else:
@@ -292,14 +1100,14 @@ class LineTaker(object):
                     split_note += matched.group(2).strip()
                 split_note = split_note.strip()
 
-            for regex in (r'^(Online Payment [0-9]+) ', r'^(Online Transfer) '):
-                matched = re.match(regex, string=split_merchant)
+            for regex in LEADING_NOTE_REGEXES:
+                matched = regex.match(split_merchant)
                 if matched:
                     split_merchant = split_merchant[len(matched.group(1)):].strip()
                     split_note += (' ' + matched.group(1))
 
-            for regex in (r'( Transaction#: [0-9]+)$',):
-                matched = re.search(regex, string=split_merchant)  # search to end, not match front
+            for regex in TRAILING_NOTE_REGEXES:
+                matched = regex.search(split_merchant)  # search to end, not match front
                 if matched:
                     split_merchant = split_merchant[:-len(matched.group(1))].strip()
                     split_note += (' ' + matched.group(1))
@@ -310,48 +1118,53 @@ class LineTaker(object):
 
         # Collect this row
 
-        key = (ymd, len(main.sortables),)  # wart: cleverly stable sort
-        row = ('', ymd, amount, split_merchant, str_notes,)
+        transaction = ledger.Transaction(
+            ordinal, cents=cents, merchant=split_merchant,
+            notes=str_notes, account=self.str_account)
 
-        sortable = (key, row,)
-        main.sortables.append(sortable)
+        self.transactions.append(transaction)
 
         # Take the lines collected
 
-        self.lines = self.lines[len_transaction_lines:]
+        self.take_lines(len_transaction_lines)
 
     def collect_credit_card_lines(self):
         """Take the lines of a Credit Card Transaction, and collect them"""
 
-        lines = self.lines
-        assert re.match(LEADING_TJ_REGEX, string=lines[0])
+        len_transaction_lines = 8
+        tokens = self.peek_tokens(len_transaction_lines)
+        assert LEADING_TJ_REGEX.match(tokens[0].line)
 
         # Require Tj-Tm pairs
 
-        len_transaction_lines = 8
-        copies = list(lines[:len_transaction_lines])
+        copies = list(tokens[:len_transaction_lines])
+
+        pair = ((copies[4].kind, copies[4].operand,), (copies[6].kind, copies[6].operand,),)
+        if pair == (('TJ', ' '), ('Tj', '&'),):
+            tokens = self.peek_tokens(12)
 
-        if (copies[4], copies[6],) == ('[( )] TJ', '(&)Tj'):
-            assert re.match(PAIRED_TM_REGEX, string=copies[5])
-            assert re.match(PAIRED_TM_REGEX, string=copies[7])
+            assert copies[5].kind == 'Tm'
+            assert copies[5].operand
+            assert copies[7].kind == 'Tm'
+            assert copies[7].operand
 
-            copies[4] = lines[4 + 4]
-            copies[5] = lines[4 + 5]
-            copies[6] = lines[4 + 6]
-            copies[7] = lines[4 + 7]
+            copies[4] = tokens[4 + 4]
+            copies[5] = tokens[4 + 5]
+            copies[6] = tokens[4 + 6]
+            copies[7] = tokens[4 + 7]
 
             len_transaction_lines += 4  # wart: who knows how often
 
-        if copies[7].endswith(' k'):
+        if copies[7].kind == 'k':
 
-            copies[7] = lines[len_transaction_lines]
+            tokens = self.peek_tokens(len_transaction_lines + 1)
+            copies[7] = tokens[len_transaction_lines]
 
             len_transaction_lines += 1  # wart: who knows how often
 
-        assert re.match(PAIRED_TM_REGEX, string=copies[1])
-        assert re.match(PAIRED_TM_REGEX, string=copies[3])
-        assert re.match(PAIRED_TM_REGEX, string=copies[5])
-        assert re.match(PAIRED_TM_REGEX, string=copies[7])
+        for index in (1, 3, 5, 7,):
+            assert copies[index].kind == 'Tm'
+            assert copies[index].operand
 
         # Extract Date-Of, Amount, Merchant
 
@@ -361,7 +1174,7 @@ class LineTaker(object):
         amount = pick_from_tj(copies[6])  # in the currency local to my bank
 
         merchant = merchant.strip()
-        assert re.match(r'^[-]?[0-9,]*[.][0-9]+$', string=amount)
+        cents = ledger.cents_from_amount(amount)  # else raise ValueError
 
         assert transaction == ' '
         assert '"' not in merchant
@@ -373,65 +1186,202 @@ class LineTaker(object):
         month = int(splits[0])
         day = int(splits[1])
 
-        year = pdf_parse.year_by_month[month]
+        year = self.year_by_month[month]
 
-        ymd = '{}-{:02}-{:02}'.format(year, month, day)
-        assert len(ymd) == len('1999-12-31')
+        ordinal = dt.date(year, month, day).toordinal()
 
         # Work up some notes of details
 
         notes = []
 
-        notes.append('{}-account'.format(pdf_parse.str_account))
+        notes.append('{}-account'.format(self.str_account))
             # WART: difficult to write leading zeroes into Csv
 
         str_notes = ', '.join(notes)
 
         # Collect this row
 
-        key = (ymd, len(main.sortables),)  # wart: cleverly stable sort
-        row = ('', ymd, amount, merchant, str_notes,)
+        transaction = ledger.Transaction(
+            ordinal, cents=cents, merchant=merchant,
+            notes=str_notes, account=self.str_account)
 
-        sortable = (key, row,)
-        main.sortables.append(sortable)
+        self.transactions.append(transaction)
 
         # Take the lines collected
 
-        self.lines = self.lines[len_transaction_lines:]
+        self.take_lines(len_transaction_lines)
 
 
-def pick_from_tj(line):
+def pick_from_tj(token):
     """Extract from the middle of '(...)Tj' or from '[(...)] TJ"""
 
-    matched = re.match(r'^\((.*)\)Tj$', string=line)
-    matched = matched or re.match(r'^\[\((.*)\)\] TJ$', string=line)
+    assert token.kind in ('Tj', 'TJ',)
 
-    stripped = matched.group(1)
+    stripped = token.operand
     return stripped
 
 
-def plain_ascii_str(bytes_):
-    """Force fit arbitrary bytes into one or more US ASCII log lines of only printable text"""
+PdfToken = collections.namedtuple('PdfToken', 'kind operand line')
+
+
+def pdf_token(line):
+    """Speak of one line as one token"""
+
+    matched = TOKEN_REGEX.fullmatch(line)
+    group = matched.lastgroup
+
+    if group == 'operator':
+        token = PdfToken(matched.group(group), operand=None, line=line)
+    elif group == 'other':
+        token = PdfToken('', operand=None, line=line)
+    else:
+        token = PdfToken(group, operand=matched.group(group), line=line)
+
+    return token
+
+
+def lines_texts(lines):
+    """Yield the text of many lines at a time, each line ending with '\n'"""
+
+    iter_lines = iter(lines)
+    while True:
+        some_lines = list(itertools.islice(iter_lines, LINES_PER_TEXT))
+        if not some_lines:
+            break
+
+        text = '\n'.join(some_lines) + '\n'
+        yield text
 
-    s = bytes_
-    s = ascii_str(s)
-    s = re.sub(r'[^\t\n\r -~]', repl='?', string=s)
-    s = s.expandtabs()  # tabsize=8
-    s = s.replace('\r\n', '\n')  # don't strip 1 trailing '\n' like '\n'.join(s.splitlines()) would
-    s = s.replace('\r', '\n')
 
-    return s
+@contextlib.contextmanager
+def mapped_bytes(filepath):
+    """Map the bytes of a file into memory, read-only, to read them without copying them"""
 
+    with open(filepath, 'rb') as reading:
+        if not os.fstat(reading.fileno()).st_size:
+            yield b''  # as Python refuses to map an empty file
+            return
 
-def ascii_str(bytes_):
-    """Convert arbitrary bytes to a 'str' (never Python 2 'unicode') of US-Ascii chars"""
+        with mmap.mmap(reading.fileno(), 0, access=mmap.ACCESS_READ) as bytes_:
+            yield bytes_
 
-    s = bytes_  # such as b'\xC0\x80' to inject decoding error
-    s = s.decode('ascii', errors='replace')  # Py 3 'str' from 'bytes', Py 2 'unicode' from 'bytes'
-    s = s.replace(u'\uFFFD', '?')  # Ascii '?' in place of each Unicode Replacement Char
-    s = str(s)  # Py 3 'str' from 'str', or Py 2 'str' from 'unicode'
 
-    return s
+def pdf_texts(bytes_, clock):
+    """Yield the text of the lines of a Pdf, with each Flate-compressed stream inflated in place"""
+
+    chunks = clock.timed('read', pdf_chunks(bytes_, clock=clock))
+    texts = clock.timed('ascii', ascii_texts(chunks))
+
+    return texts
+
+
+def pdf_chunks(bytes_, clock):
+    """Yield the bytes of a Pdf in chunks, with each Flate-compressed stream inflated in place"""
+
+    index = 0  # index of next byte not yet yielded
+
+    pos = 0
+    while True:
+        matched = STREAM_REGEX.search(bytes_, pos)
+        if not matched:
+            break
+
+        start = matched.end()
+        stop = bytes_.find(b'endstream', start)
+        if stop < 0:
+            break
+
+        clock.count('stream_matches')
+
+        head = b''
+        obj_index = bytes_.rfind(b'obj', max(0, matched.start() - OBJ_LOOK_BACK), matched.start())
+        if obj_index >= 0:
+            head = bytes_[obj_index:matched.start()]
+
+        if b'/FlateDecode' in head:  # wart: inflates each Flate stream, not only Content streams
+            clock.count('flate_streams')
+
+            yield from raw_chunks(bytes_, start=index, stop=start)
+            yield from inflated_chunks(bytes_, start=start, stop=stop)
+            yield b'\n'  # end the last line of the stream, before the 'endstream'
+
+            index = stop
+
+        pos = stop
+
+    yield from raw_chunks(bytes_, start=index, stop=len(bytes_))
+
+
+def raw_chunks(bytes_, start, stop):
+    """Yield a slice of bytes in chunks"""
+
+    for offset in range(start, stop, CHUNK_SIZE):
+        chunk = bytes_[offset:min(offset + CHUNK_SIZE, stop)]
+        yield chunk
+
+
+def inflated_chunks(bytes_, start, stop):
+    """Yield the inflation of a slice of Flate-compressed bytes, in chunks"""
+
+    inflater = zlib.decompressobj()
+
+    try:
+        for chunk in raw_chunks(bytes_, start=start, stop=stop):
+            while chunk and not inflater.eof:
+                yield inflater.decompress(chunk, CHUNK_SIZE)
+                chunk = inflater.unconsumed_tail
+            if inflater.eof:
+                break
+    except zlib.error:
+        pass  # wart: keep what inflated, trash the rest silently
+
+
+def ascii_texts(chunks):
+    """Yield the text of whole lines of arbitrary bytes, as printable US Ascii, ending in '\n'"""
+
+    partial = ''  # chars of the last line, till its end arrives
+    held = b''  # '\r' held back, in case the next chunk starts with '\n'
+
+    for chunk in chunks:
+        chunk = held + chunk
+
+        held = b''
+        if chunk.endswith(b'\r'):
+            held = b'\r'
+            chunk = chunk[:-1]
+
+        s = chunk.translate(PLAIN_ASCII_TABLE)  # one pass, in place of decode, sub, replace
+        if b'\r' in s:
+            s = s.replace(b'\r\n', b'\n')
+            s = s.replace(b'\r', b'\n')
+
+        s = partial + s.decode('ascii')
+        cut = (s.rfind('\n') + 1)
+        partial = s[cut:]
+
+        if cut:
+            yield expand_tabs(s[:cut])
+
+    if held:
+        yield expand_tabs(partial + '\n')
+        partial = ''
+
+    yield expand_tabs(partial + '\n')  # more like 'vi' than chars.splitlines()
+
+
+def expand_tabs(chars):
+    """Expand tabs, but only if present, to skip copying the chars"""
+
+    if '\t' not in chars:
+        return chars
+
+    expanded = chars.expandtabs()  # tabsize=8
+    return expanded
+
 
 # TODO: Add notes of parsing difficulties to transactions
 # TODO: Emit local price before exchange rate applied
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+
+r"""
+Hold transactions compactly, to pass them from chase.py to mark.py without reparsing them
+
+Keep each date as an ordinal day, each amount as integer cents, and each string only once
+"""
+
+
+import array
+import datetime as dt
+import itertools
+import mmap
+import operator
+import os
+import struct
+
+
+# Write a ledger file as a header, then fixed-width columns, then a table of strings
+#
+#   Count rows and strings in the header, and give the first and last day
+#   Give each column of the TransactionBatch as 8-byte integers, in native byte order
+#   Give the offsets of each string, then the strings, as Utf-8
+#
+#   Add 1 to the LEDGER_MAGIC to refuse every ledger file written before, at any change of layout
+#
+
+LEDGER_PATH = 'chase-ledger.bin'
+
+LEDGER_MAGIC = b'PLPYLDG1'
+LEDGER_BYTE_ORDER = 0x0102030405060708  # reads differently in the other byte order
+
+LEDGER_HEADER = struct.Struct('=8sqqqqq')  # magic, order, rows, first day, last day, strings
+
+LEDGER_COLUMNS = ('ordinals', 'cents', 'merchant_indices', 'notes_indices', 'account_indices',)
+
+
+CENTS_BY_PENNIES = dict(  # such as '05' as 5 cents, and '5' as 50 cents, not as 5 cents
+    [('{:02}'.format(_), _,) for _ in range(100)] + [(str(_), 10 * _,) for _ in range(10)])
+
+SHAPE_BY_DIGIT = str.maketrans('0123456789', '9999999999')  # to find the shape of amounts
+DIGITS_BY_AMOUNT = str.maketrans('', '', ',.')  # to keep just the sign and digits of amounts
+
+
+class Transaction(object):
+    """Hold one transaction, with its date as an ordinal day, and its amount as integer cents"""
+
+    __slots__ = ('ordinal', 'cents', 'merchant', 'notes', 'account',)
+
+    def __init__(self, ordinal, cents, merchant, notes, account):
+
+        self.ordinal = ordinal  # as in 'datetime.date.toordinal'
+        self.cents = cents  # negative for money in, such as credit card payments
+        self.merchant = merchant
+        self.notes = notes
+        self.account = account  # as digits, to keep leading zeroes
+
+    def __repr__(self):
+
+        repr_ = 'Transaction({})'.format(', '.join(repr(_) for _ in self.fields()))
+        return repr_
+
+    def fields(self):
+        """List the fields, in the order of the args of the constructor"""
+
+        fields = (self.ordinal, self.cents, self.merchant, self.notes, self.account,)
+        return fields
+
+    def ymd(self):
+        """Format the date as Yyyy-mm-dd"""
+
+        ymd = dt.date.fromordinal(self.ordinal).isoformat()
+        return ymd
+
+    def amount(self):
+        """Format the amount as Chase formats it, such as '-1,234.56'"""
+
+        amount = amount_from_cents(self.cents)
+        return amount
+
+    def to_row(self):
+        """Form a Csv row, as exported by chase.py"""
+
+        row = ('', self.ymd(), self.amount(), self.merchant, self.notes,)
+        return row
+
+    @classmethod
+    def from_row(cls, row):
+        """Take a Csv row, as exported by chase.py"""
+
+        (_, ymd, amount, merchant, notes,) = row
+
+        ordinal = dt.date.fromisoformat(ymd).toordinal()
+        cents = cents_from_amount(amount)
+        account = account_from_notes(notes)
+
+        transaction = cls(ordinal, cents=cents, merchant=merchant, notes=notes, account=account)
+        return transaction
+
+
+class TransactionBatch(object):
+    """Hold many transactions as columns of integers, with each string held only once"""
+
+    def __init__(self):
+
+        self.ordinals = array.array('q')
+        self.cents = array.array('q')
+
+        self.merchant_indices = array.array('q')  # indices into self.strings
+        self.notes_indices = array.array('q')
+        self.account_indices = array.array('q')
+
+        self.strings = []  # each merchant, notes, and account, only once
+        self.index_by_string = dict()
+
+    def __len__(self):
+
+        len_ = len(self.ordinals)
+        return len_
+
+    def __getitem__(self, index):
+
+        strings = self.strings
+
+        transaction = Transaction(
+            self.ordinals[index],
+            cents=self.cents[index],
+            merchant=strings[self.merchant_indices[index]],
+            notes=strings[self.notes_indices[index]],
+            account=strings[self.account_indices[index]])
+
+        return transaction
+
+    def __iter__(self):
+
+        for index in range(len(self)):
+            yield self[index]
+
+    def intern(self, string):
+        """Find the index of a string, else add it"""
+
+        index = self.index_by_string.get(string)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(string)
+            self.index_by_string[string] = index
+
+        return index
+
+    def append(self, transaction):
+        """Add one transaction"""
+
+        self.ordinals.append(transaction.ordinal)
+        self.cents.append(transaction.cents)
+
+        self.merchant_indices.append(self.intern(transaction.merchant))
+        self.notes_indices.append(self.intern(transaction.notes))
+        self.account_indices.append(self.intern(transaction.account))
+
+    def extend(self, transactions):
+        """Add many transactions"""
+
+        for transaction in transactions:
+            self.append(transaction)
+
+    def extend_rows(self, rows):
+        """Add many Csv rows, as exported by chase.py, converting whole columns at a time"""
+
+        rows = list(rows)
+        assert all((len(_) == 5) for _ in rows)
+
+        self.ordinals.extend(dt.date.fromisoformat(_[1]).toordinal() for _ in rows)
+        self.cents.extend(cents_from_amounts(_[2] for _ in rows))
+
+        intern = self.intern
+        self.merchant_indices.extend(intern(_[3]) for _ in rows)
+        self.notes_indices.extend(intern(_[-1]) for _ in rows)
+        self.account_indices.extend(intern(account_from_notes(_[-1])) for _ in rows)
+
+    def to_bytes(self):
+        """Form the bytes of a ledger file"""
+
+        len_rows = len(self)
+        (first_day, last_day,) = (0, 0,)
+        if len_rows:
+            (first_day, last_day,) = (min(self.ordinals), max(self.ordinals),)
+
+        header = LEDGER_HEADER.pack(
+            LEDGER_MAGIC, LEDGER_BYTE_ORDER, len_rows, first_day, last_day, len(self.strings))
+
+        encodeds = [_.encode() for _ in self.strings]
+        offsets = array.array('q', itertools.accumulate((len(_) for _ in encodeds), initial=0))
+
+        chunks = [header]
+        chunks.extend(array.array('q', getattr(self, _)).tobytes() for _ in LEDGER_COLUMNS)
+        chunks.append(offsets.tobytes())
+        chunks.extend(encodeds)
+
+        bytes_ = b''.join(chunks)
+        return bytes_
+
+    @classmethod
+    def from_bytes(cls, bytes_):
+        """Take the bytes of a ledger file, viewing its columns in place, without copying them"""
+
+        (magic, byte_order, len_rows, _, _, len_strings,) = LEDGER_HEADER.unpack_from(bytes_)
+        assert magic == LEDGER_MAGIC, magic
+        assert byte_order == LEDGER_BYTE_ORDER, hex(byte_order)
+
+        view = memoryview(bytes_)
+        index = LEDGER_HEADER.size
+
+        batch = cls()
+        for column in LEDGER_COLUMNS:
+            width = 8 * len_rows
+            setattr(batch, column, view[index:][:width].cast('q'))
+            index += width
+
+        width = 8 * (len_strings + 1)
+        offsets = view[index:][:width].cast('q')
+        index += width
+
+        for (start, stop,) in zip(offsets, offsets[1:]):
+            string = bytes(view[(index + start):(index + stop)]).decode()
+            batch.strings.append(string)
+            batch.index_by_string[string] = len(batch.index_by_string)
+
+        return batch
+
+
+def ledger_dump(path, batch):
+    """Write a ledger file, all at once, never leaving it half written"""
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as writing:
+        writing.write(batch.to_bytes())
+
+    os.replace(tmp_path, path)
+
+
+def ledger_load(path):
+    """Map a ledger file into memory, and view its columns there, without parsing rows"""
+
+    with open(path, 'rb') as reading:
+        bytes_ = mmap.mmap(reading.fileno(), length=0, access=mmap.ACCESS_READ)
+
+    batch = TransactionBatch.from_bytes(bytes_)  # wart: the columns keep the map open
+
+    return batch
+
+
+def account_from_notes(notes):
+    """Pick the account out of the notes, as written by chase.py, else return ''"""
+
+    head = notes.partition(',')[0]
+
+    account = ''
+    if head.endswith('-account'):
+        account = head[:-len('-account')]
+
+    return account
+
+
+def amount_from_cents(cents):
+    """Format integer cents as Chase formats an amount, such as '-1,234.56'"""
+
+    sign = '-' if (cents < 0) else ''
+    (dollars, pennies,) = divmod(abs(cents), 100)
+
+    amount = '{}{:,}.{:02}'.format(sign, dollars, pennies)
+    return amount
+
+
+def cents_from_amount(amount, signed=True):
+    """Convert to integer cents from an amount formatted as Chase formats it, such as '-1,234.56'
+
+    Take only an optional '-', then Ascii digits, maybe grouped in threes by commas, then '.'
+    and one or two Ascii digits, else raise ValueError, with no regex
+    """
+
+    chars = amount
+
+    sign = 1
+    if signed and chars.startswith('-'):
+        sign = -1
+        chars = chars[len('-'):]
+
+    # Take the pennies, as one or two digits after the last '.'
+
+    (dollars, dot, pennies,) = chars.rpartition('.')
+
+    cents = CENTS_BY_PENNIES.get(pennies)
+    if (cents is None) or not dot:
+        raise ValueError('amount not ending with 1 or 2 digits after a dot: {!r}'.format(amount))
+
+    # Take the dollars, requiring 3 digits after each comma, and 1 to 3 digits before the first
+
+    len_commas = dollars.count(',')
+    if len_commas:
+        len_first = dollars.index(',')
+        commas = dollars[len_first::4]
+        if not (1 <= len_first <= 3) or (len(dollars) != (len_first + 4 * len_commas)) or (
+                commas != (',' * len_commas)):
+            raise ValueError('amount not grouped in threes: {!r}'.format(amount))
+        dollars = dollars.replace(',', '')
+
+    if dollars:
+        if not (dollars.isdecimal() and dollars.isascii()):
+            raise ValueError('amount not of digits: {!r}'.format(amount))
+        cents += int(dollars) * 100
+
+    cents *= sign
+
+    return cents
+
+
+def cents_from_amounts(amounts, signed=True):
+    """Convert a whole column of amounts to integer cents, checking each shape only once
+
+    Find the shape of every amount, such as '9,999.99', by mapping each digit to '9', then check
+    each distinct shape with 'cents_from_amount', then convert every amount with no loop in Python
+    """
+
+    amounts = list(amounts)
+
+    joined = '\n'.join(amounts)
+    shapes = joined.translate(SHAPE_BY_DIGIT).split('\n')
+    if len(shapes) != len(amounts):  # as no amounts came, or some amount held a newline
+        column = array.array('q', (cents_from_amount(_, signed=signed) for _ in amounts))
+        return column
+
+    scale_by_shape = dict()  # such as 10 for '9.9', as '1.5' means 150 cents
+    try:
+        for shape in set(shapes):
+            cents_from_amount(shape, signed=signed)
+            scale_by_shape[shape] = 10 if (shape[-2:-1] == '.') else 1
+    except ValueError:
+        for amount in amounts:
+            cents_from_amount(amount, signed=signed)  # to raise ValueError of the first bad one
+        raise
+
+    digits = joined.translate(DIGITS_BY_AMOUNT).split('\n')
+
+    column = array.array('q', map(
+        operator.mul, map(int, digits), map(scale_by_shape.__getitem__, shapes)))
+    return column
@@ -5,81 +5,451 @@ Divide transactions into categories, by marking them with labels
 """
 
 
+import argparse
+import bisect
 import collections
 import csv
 import datetime as dt
-import re
+import hashlib
+import heapq
+import json
+import os
+import sys
+import tempfile
 
+import categories
+import charts
+import ledger
+import recurring
+import rollups
+import stages
+import store
 
-def main():
+
+RULES_PATH = 'category-by-merchant-csv.csv'
+
+STATS_PATH = 'mark-stats.json'
+
+
+# Cache the category of each merchant, till the rules change, or till the matching changes
+#
+#   Add 1 to the MATCHER_VERSION to forget every merchant matched before, at any change of matching
+#
+
+CACHE_PATH = 'mark-cache.json'
+CACHE_MAX_MERCHANTS = 100 * 1000
+
+MATCHER_VERSION = 1
+
+
+# Fold only the transactions not marked before into the sums, if asked
+#
+#   Cut the transactions marked at RESUME_MAX_DAYS before the last day marked
+#   Before the cut, remember a digest of the bytes of the columns, to check them in one pass in C
+#   After the cut, remember how many transactions of each account got marked on each day
+#
+#   Start over at any change of rules, or at any transaction marked before found changed or gone,
+#   or at any transaction found before the cut, such as from a statement arriving late,
+#   or found sorted before a transaction marked before, of the same account on the same day
+#
+
+STATE_PATH = 'mark-state.json'
+RESUME_MAX_DAYS = 92  # to fold in statements dated as much as a quarter before the last
+
+
+# Sort in runs of a budget of rows, if asked to stream
+#
+#   Spill each sorted run to disk, then merge the runs, to hold no more rows than the budget
+#
+
+SORT_MAX_ROWS = 100 * 1000
+
+
+def main(argv=None, batch=None, transactions=None):
     """Divide transactions into categories, by marking them with labels"""
 
     when_launched = dt.datetime.now()
 
-    # Map merchants to categories
+    parser = mark_compile_argdoc()
+    args = parser.parse_args(argv[1:] if argv else [])
 
-    category_by_merchant = dict()
+    clock = stages.StageClock()
+    clock.lap('read')
 
-    csv_reader = csv.reader(open('category-by-merchant-csv.csv'))
-    header_row = next(csv_reader)
-    assert header_row == ['', 'Category', 'Merchant']
+    # Recall the category of each merchant seen before, unless the rules changed since
 
-    for row in csv_reader:
-        (_, category, merchant,) = row
-        category_by_merchant[merchant] = category
+    with open(RULES_PATH, 'rb') as reading:
+        rules_digest = hashlib.sha256(reading.read()).hexdigest()
 
-    # Join categories to transactions
+    cache = CategoryCache(
+        CACHE_PATH, max_merchants=args.cache_max_merchants, rules_digest=rules_digest)
+    if not args.no_cache:
+        cache.load()
 
-    csv_writer = csv.writer(open('chase-mark-csv.csv', 'w'))
+    category_index = None  # compiled only if some merchant misses the cache
 
-    csv_reader = csv.reader(open('chase-export-csv.csv'))
-    header_row = next(csv_reader)
-    assert header_row == ['', 'Yyyy-mm-dd', 'Amount', 'Merchant', 'Notes']
+    if (not args.incremental) and os.path.exists(STATE_PATH):
+        os.remove(STATE_PATH)  # as marking every transaction again leaves it stale
 
-    csv_rows = list(csv_reader)  # discover empty before writing header out
+    # Take transactions from Chase Py, else map its ledger file, else read them back from its Csv
 
-    marked_rows = []
-    more_merchants = set()
-    if csv_rows:
+    header_row = ['', 'Yyyy-mm-dd', 'Amount', 'Merchant', 'Notes']
+
+    if args.stream:  # wart: marks without holding every transaction, so publishes none
+
+        if args.incremental or args.rollups or args.charts or args.recurring or args.store:
+            parser.error('--stream marks and sums only, without any of'
+                ' --incremental, --rollups, --charts, --recurring, or --store')
+
+        if batch is not None:
+            transactions = batch
+        if (transactions is None) and args.ledger:
+            transactions = ledger.ledger_load(ledger.LEDGER_PATH)
+        if transactions is None:
+            csv_reader = csv.reader(open('chase-export-csv.csv'))
+            assert next(csv_reader) == header_row
+            transactions = (ledger.Transaction.from_row(_) for _ in csv_reader)
+
+        mark_stream(transactions, cache=cache, max_rows=args.sort_max_rows, clock=clock)
+
+        if not args.no_cache:
+            cache.dump()
+
+        run_time_dump(args, cache=cache, clock=clock, when_launched=when_launched)
+
+        return None
+
+    if (batch is None) and (transactions is not None):
+        batch = ledger.TransactionBatch()
+        batch.extend(transactions)  # wart: marks nothing till Chase Py yields all
+
+    if (batch is None) and args.ledger:
+        batch = ledger.ledger_load(ledger.LEDGER_PATH)
+
+    if batch is None:
+        csv_reader = csv.reader(open('chase-export-csv.csv'))
+        assert next(csv_reader) == header_row
+
+        batch = ledger.TransactionBatch()
+        batch.extend_rows(csv_reader)
+
+    # Resume past the transactions marked before, if asked, and if not asked to start over
+
+    state = MarkState(STATE_PATH, rules_digest=rules_digest)
+    if args.incremental:
+        state.load()
+
+    indices = state.resume_indices(batch)  # None to start over
+    resumed = (indices is not None)
+    if not resumed:
+        indices = range(len(batch))
+
+    cents_by_category = collections.defaultdict(int)
+    cents_by_category.update(state.cents_by_category)
+    more_merchants = set(state.more_merchants)
+
+    # Join categories to new transactions, looking up each distinct merchant only once
+
+    clock.lap('categorize')
+
+    args.rollups = args.rollups or args.charts  # as the charts draw from the rollups
+
+    merchant_indices = [batch.merchant_indices[_] for _ in indices]
+    if args.store or (args.rollups and not state.rollups):
+        merchant_indices = batch.merchant_indices  # as these need every transaction marked
+
+    category_by_index = dict()
+    for index in set(merchant_indices):
+        merchant = batch.strings[index]
+
+        category = cache.lookup(merchant)
+        if category is None:
+            if category_index is None:
+                category_index = category_index_from_csv(RULES_PATH)
+            category = category_index.classify(merchant) or ''  # wart: sorts None as ''
+            cache.store(merchant, category=category)
+
+        if not category:
+            more_merchants.add(merchant)
+
+        category_by_index[index] = category
+
+    category_by_row = dict(
+        (index, category_by_index[batch.merchant_indices[index]],) for index in indices)
+
+    marked_indices = sorted(indices, key=lambda _: (category_by_row[_], _,))
+    clock.count('transactions', delta=len(marked_indices))
+    clock.count('transactions_resumed', delta=(len(batch) - len(marked_indices)))
+    clock.count('merchants', delta=len(category_by_index))
+    clock.count('more_merchants', delta=len(more_merchants))
+    clock.count('category_cache_hits', delta=cache.len_hits)
+    clock.count('category_cache_misses', delta=cache.len_misses)
+
+    if not args.no_cache:
+        cache.dump()
+
+    clock.lap('csv_write')
+
+    if resumed:
+        csv_writer = csv.writer(open('chase-mark-csv.csv', 'a'))
+            # wart: appends new transactions, sorted only among themselves
+    else:
+        csv_writer = csv.writer(open('chase-mark-csv.csv', 'w'))
+
+    if marked_indices and not resumed:  # discover empty before writing header out
 
         marked_header_row = list(header_row)
         marked_header_row[3:3] = ['Category']
         csv_writer.writerow(marked_header_row)
 
-        sortables = []
-        for row in csv_rows:
-            (_, ymd, amount, merchant, notes,) = row
+    for index in marked_indices:
+        transaction = batch[index]
+
+        marked_row = (
+            '', transaction.ymd(), transaction.amount(),
+            category_by_row[index], transaction.merchant, transaction.notes,)
+
+        csv_writer.writerow(marked_row)
+
+    # Sum amounts by category, as integer cents, leaving out money in
+
+    clock.lap('aggregate')
+
+    for (index, category,) in category_by_row.items():
+        cents = batch.cents[index]
+        if cents >= 0:
+            cents_by_category[category] += cents
+
+    rollups_json = None
+    if args.rollups:
+        clock.lap('rollup')
+
+        if state.rollups:  # fold only the new transactions into the sums before
+            (categories_, cubes,) = rollups.rollups_merge(
+                rollups.rollups_from_json(state.rollups),
+                rollups.rollup(batch, category_by_index=category_by_index, indices=indices))
+        else:
+            (categories_, cubes,) = rollups.rollup(batch, category_by_index=category_by_index)
+
+        rollups.rollups_dump(categories_, cubes=cubes)
+        rollups_json = rollups.rollups_to_json(categories_, cubes=cubes)
+
+        if args.charts:
+            clock.lap('chart')
+            charts.charts_dump(categories_, cube=cubes['month'])
+
+        clock.lap('aggregate')
+
+    if args.incremental:
+        state.dump(batch, cents_by_category=cents_by_category, more_merchants=more_merchants,
+            rollups_json=rollups_json)
+
+    if args.store:
+        clock.lap('store_write')
+        category_by_merchant = dict(
+            (batch.strings[index], category,) for (index, category,) in category_by_index.items())
+        store.store_mark(store.STORE_PATH, category_by_merchant=category_by_merchant)
+        clock.lap('aggregate')
+
+    if args.recurring:
+        clock.lap('recurring')
+        recurrences = recurring.find_recurrences(batch)
+        recurring.recurrences_dump(recurrences)
+        clock.count('recurrences', delta=len(recurrences))
+        clock.lap('aggregate')
+
+    sums_dump(cents_by_category)
+    more_merchants_dump(more_merchants)
+
+    run_time_dump(args, cache=cache, clock=clock, when_launched=when_launched)
+
+    # Publish Transactions, as marked
+
+    return batch
+
+
+def mark_compile_argdoc():
+    """Construct the helplines for a parser, and the parser itself, to parse a command line"""
+
+    parser = argparse.ArgumentParser(
+        prog='mark',
+        formatter_class=argparse.RawTextHelpFormatter,
+        )
+
+    parser.add_argument('--ledger', action='store_true',
+        help='read {!r}, in place of {!r}'.format(ledger.LEDGER_PATH, 'chase-export-csv.csv'))
+    parser.add_argument('--stats', action='store_true',
+        help='write the time of each stage to {!r} (or set {}=1)'.format(
+            STATS_PATH, stages.STATS_ENV))
+    parser.add_argument('--no-cache', action='store_true',
+        help='match every merchant again, without reading or writing {!r}'.format(CACHE_PATH))
+    parser.add_argument('--rollups', action='store_true',
+        help='also sum by category and by month, week, account, and year, into more Csv')
+    parser.add_argument('--charts', action='store_true',
+        help='also draw the rollups by month as Svg charts, such as {!r}'.format(
+            charts.CHART_PATHS['bars']))
+    parser.add_argument('--recurring', action='store_true',
+        help='also list the charges that recur, multiplied out to yearly costs, in {!r}'.format(
+            recurring.RECURRING_PATH))
+    parser.add_argument('--store', action='store_true',
+        help='also mark the category of each transaction in {!r}'.format(store.STORE_PATH))
+    parser.add_argument('--incremental', action='store_true',
+        help='mark only the transactions not remembered in {!r},\n'
+            'appending them to {!r} sorted by category only among themselves'.format(
+                STATE_PATH, 'chase-mark-csv.csv'))
+    parser.add_argument('--stream', action='store_true',
+        help='mark and sum each transaction as it comes, sorting in runs spilled to disk,\n'
+            'without holding every transaction, or publishing them')
+    parser.add_argument('--sort-max-rows', metavar='N', type=int, default=SORT_MAX_ROWS,
+        help='with --stream, spill sorted runs to disk past N rows held in memory'
+            ' (default: {})'.format(SORT_MAX_ROWS))
+    parser.add_argument('--cache-max-merchants', metavar='N', type=int,
+        default=CACHE_MAX_MERCHANTS,
+        help='forget the least recently used merchants past N (default: {})'.format(
+            CACHE_MAX_MERCHANTS))
+
+    return parser
+
+
+def run_time_dump(args, cache, clock, when_launched):
+    """Count the cost of run time"""
+
+    when_quit = dt.datetime.now()
+    print('Mark Py found {} of {} merchants in cache'.format(
+        cache.len_hits, cache.len_hits + cache.len_misses))
+    print('Mark Py ran inside', when_quit - when_launched)
+
+    if stages.stats_wanted(args.stats):
+        stages.stats_dump(STATS_PATH, clock=clock, program='mark')
+
+
+def mark_stream(transactions, cache, max_rows, clock):
+    """Mark each transaction as it comes, and sum it, then sort them all in bounded memory"""
+
+    category_index = None  # compiled only if some merchant misses the cache
+
+    category_by_merchant = dict()  # of each merchant seen, to look up each only once
+    cents_by_category = collections.defaultdict(int)
+    more_merchants = set()
+
+    runs = MarkedRuns(max_rows=max_rows)
+
+    clock.lap('categorize')
+
+    for (position, transaction,) in enumerate(transactions):
+        merchant = transaction.merchant
+
+        category = category_by_merchant.get(merchant)
+        if category is None:
+            category = cache.lookup(merchant)
+            if category is None:
+                if category_index is None:
+                    category_index = category_index_from_csv(RULES_PATH)
+                category = category_index.classify(merchant) or ''  # wart: sorts None as ''
+                cache.store(merchant, category=category)
 
-            category = category_by_merchant.get(merchant)
             if not category:
                 more_merchants.add(merchant)
 
-            sort_key = (category, len(sortables),)
-            marked_row = ('', ymd, amount, category, merchant, notes,)
-            sortable = (sort_key, marked_row,)
+            category_by_merchant[merchant] = category
 
-            sortables.append(sortable)
+        if transaction.cents >= 0:  # leaving out money in
+            cents_by_category[category] += transaction.cents
 
-        sortables.sort()
-        for sortable in sortables:
-            (_, marked_row) = sortable
-            csv_writer.writerow(marked_row)
+        marked_row = (
+            '', transaction.ymd(), transaction.amount(),
+            category, merchant, transaction.notes,)
 
-            marked_rows.append(marked_row)
+        runs.add_marked_row(position, marked_row=marked_row)
 
-    # Sum amounts by category
+    clock.count('transactions', delta=runs.len_rows)
+    clock.count('merchants', delta=len(category_by_merchant))
+    clock.count('more_merchants', delta=len(more_merchants))
+    clock.count('category_cache_hits', delta=cache.len_hits)
+    clock.count('category_cache_misses', delta=cache.len_misses)
+    clock.count('spilled_runs', delta=len(runs.spills))
 
-    csv_writer = csv.writer(open('sum-by-category-csv.csv', 'w'))
-    csv_writer.writerow('Amount Category'.split())
+    # Write the rows sorted by category, and else by position, by merging the sorted runs
 
-    cents_by_category = collections.defaultdict(int)
-    for marked_row in marked_rows:
-        (_, _, amount, category, _, _,) = marked_row
+    clock.lap('csv_write')
 
-        assert re.match(r'^[-]?[0-9,]*[.][0-9][0-9]$', string=amount)
-        if not amount.startswith('-'):
-            cents = int(amount.replace(',', '').replace('.', ''))
-            cents_by_category[category] += cents
+    csv_writer = csv.writer(open('chase-mark-csv.csv', 'w'))
+
+    if runs.len_rows:  # discover empty before writing header out
+        csv_writer.writerow(['', 'Yyyy-mm-dd', 'Amount', 'Category', 'Merchant', 'Notes'])
+
+    for (_, marked_row,) in runs.merge():
+        csv_writer.writerow(marked_row)
+
+    clock.lap('aggregate')
+
+    sums_dump(cents_by_category)
+    more_merchants_dump(more_merchants)
+
+
+class MarkedRuns(object):
+    """Sort marked rows by category, then by position, spilling sorted runs past a budget"""
+
+    def __init__(self, max_rows):
+
+        self.max_rows = max_rows
+
+        self.run = []  # the one sorted run held in memory, unsorted till spilled or merged
+        self.spills = []  # sorted runs spilled to disk
+
+        self.len_rows = 0  # count of rows added
+
+    def add_marked_row(self, position, marked_row):
+        """Add one marked row, spilling the rows held, if past the budget"""
+
+        category = marked_row[3]
+        sortable = ((category, position,), marked_row,)
+        self.run.append(sortable)
+
+        self.len_rows += 1
+
+        if len(self.run) >= self.max_rows:
+            self.spill_run()
+
+    def spill_run(self):
+        """Sort the rows held in memory into one run on disk"""
+
+        spill = tempfile.TemporaryFile('w+', newline='')
+        csv_writer = csv.writer(spill)
+
+        self.run.sort()
+        for ((_, position,), marked_row,) in self.run:
+            csv_writer.writerow((position,) + marked_row[1:])
+
+        spill.seek(0)
+        self.spills.append(spill)
+
+        self.run = []
+
+    def merge(self):
+        """Yield every sortable added, in order, by merging each run"""
+
+        self.run.sort()
+
+        spilled_runs = [self.read_spill(_) for _ in self.spills]
+        yield from heapq.merge(*spilled_runs, self.run)
+
+    def read_spill(self, spill):
+        """Yield the sortables of a run spilled to disk, then close it"""
+
+        with spill:
+            for fields in csv.reader(spill):
+                position = int(fields[0])
+                marked_row = ('',) + tuple(fields[1:])
+
+                yield ((marked_row[3], position,), marked_row,)
+
+
+def sums_dump(cents_by_category):
+    """Write the sums of money out by category, costliest first, as a Csv table"""
+
+    csv_writer = csv.writer(open('sum-by-category-csv.csv', 'w'))
+    csv_writer.writerow('Amount Category'.split())
 
     sortables = []
     for category in sorted(cents_by_category.keys()):
@@ -109,7 +479,9 @@ def main():
     csv_writer.writerow(empty_row)
     csv_writer.writerow(empty_row)
 
-    # List the uncategorized merchants
+
+def more_merchants_dump(more_merchants):
+    """List the uncategorized merchants, as a Csv table, for the rules to take up later"""
 
     csv_writer = csv.writer(open('more-merchants-csv.csv', 'w'))
 
@@ -121,7 +493,282 @@ def main():
             row = ('', category, merchant,)
             csv_writer.writerow(row)
 
-    # Count the cost of run time
 
-    when_quit = dt.datetime.now()
-    print('Mark Py ran inside', when_quit - when_launched)
+def category_index_from_csv(path):
+    """Compile the rules of a Csv, by exact match, else by the Match column, if present"""
+
+    category_index = categories.CategoryIndex()
+
+    csv_reader = csv.reader(open(path))
+    header_row = next(csv_reader)
+    assert header_row[:3] == ['', 'Category', 'Merchant']
+    assert header_row[3:] in ([], ['Match'],)
+
+    for row in csv_reader:
+        (_, category, merchant,) = row[:3]
+        match = (row[3:4] or ['exact'])[0] or 'exact'
+        assert match in categories.MATCHES, (match, row,)
+
+        category_index.add(category, merchant=merchant, match=match)  # wart: last row wins
+
+    category_index.compile()
+
+    return category_index
+
+
+class CategoryCache(object):
+    """Remember the category of each merchant, till the rules change or the matching changes"""
+
+    def __init__(self, path, max_merchants, rules_digest):
+
+        self.path = path
+        self.max_merchants = max_merchants
+        self.rules_digest = rules_digest
+
+        self.category_by_merchant = collections.OrderedDict()  # least recently used first
+
+        self.len_hits = 0
+        self.len_misses = 0
+
+    def load(self):
+        """Read the cache from disk, else start over empty"""
+
+        try:
+            with open(self.path) as reading:
+                whole = json.load(reading)
+        except (OSError, ValueError):
+            return
+
+        if whole.get('version') == MATCHER_VERSION:
+            if whole.get('sha256') == self.rules_digest:
+                self.category_by_merchant.update(whole['categories'])
+
+    def dump(self):
+        """Write the cache to disk, never leaving it half written"""
+
+        items = list(self.category_by_merchant.items())  # least recently used first
+        whole = dict(version=MATCHER_VERSION, sha256=self.rules_digest, categories=items)
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as writing:
+            json.dump(whole, writing)
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, merchant):
+        """Return the category of a merchant matched before, else None"""
+
+        category = self.category_by_merchant.get(merchant)
+        if category is None:
+            self.len_misses += 1
+            return None
+
+        self.len_hits += 1
+        self.category_by_merchant.move_to_end(merchant)
+
+        return category
+
+    def store(self, merchant, category):
+        """Remember the category of a merchant, after a lookup missed"""
+
+        self.category_by_merchant[merchant] = category
+
+        while len(self.category_by_merchant) > self.max_merchants:
+            self.category_by_merchant.popitem(last=False)
+
+
+class MarkState(object):
+    """Remember the sums of the transactions marked, and which transactions got marked"""
+
+    def __init__(self, path, rules_digest):
+
+        self.path = path
+        self.rules_digest = rules_digest
+
+        self.start_over()
+
+    def start_over(self):
+        """Forget every transaction marked before"""
+
+        self.cents_by_category = dict()
+        self.more_merchants = []
+        self.rollups = None  # Json of the sums by category and by month, week, etc, if any
+
+        self.cut = None  # the first day after the transactions digested in bulk, if any
+        self.len_before = 0  # count of transactions before the cut
+        self.len_strings = 0  # count of strings, enough to name each merchant before the cut
+        self.digest_before = None
+
+        self.counts_by_account = dict()  # [day, count,] of the days on or after the cut
+        self.digest_by_account = dict()  # of the transactions on or after the cut
+
+    def load(self):
+        """Read the state from disk, else start over empty"""
+
+        try:
+            with open(self.path) as reading:
+                whole = json.load(reading)
+        except (OSError, ValueError):
+            return
+
+        if whole.get('version') != MATCHER_VERSION:
+            return
+        if whole.get('sha256') != self.rules_digest:
+            return
+        if 'digest_before' not in whole:
+            return  # as written before cutting the transactions marked
+
+        self.cents_by_category = whole['cents_by_category']
+        self.more_merchants = whole['more_merchants']
+        self.rollups = whole.get('rollups')
+
+        self.cut = whole['cut']
+        self.len_before = whole['len_before']
+        self.len_strings = whole['len_strings']
+        self.digest_before = whole['digest_before']
+
+        self.counts_by_account = whole['counts_by_account']
+        self.digest_by_account = whole['digest_by_account']
+
+    def dump(self, batch, cents_by_category, more_merchants, rollups_json):
+        """Write the state to disk, cut anew, looking only past the cut before"""
+
+        # Move the cut up, to some days before the last day marked
+
+        cut = None
+        len_before = 0
+        len_strings = 0
+        if len(batch):
+            cut = max(batch.ordinals[-1] - RESUME_MAX_DAYS, self.cut or 0)  # as sorted by date
+            len_before = bisect.bisect_left(batch.ordinals, cut, lo=self.len_before)
+
+            merchant_indices = batch.merchant_indices[self.len_before:len_before]
+            len_strings = max(self.len_strings, max(merchant_indices, default=-1) + 1)
+
+        # Count the transactions of each account of each day past the cut
+
+        counts_by_account = dict()
+        digest_by_account = dict()
+        for (account, indices,) in indices_by_account(batch, start=len_before).items():
+            indices_by_ordinal = indices_by_day(batch, indices=indices)
+            counts_by_account[account] = [[o, len(_)] for (o, _,) in indices_by_ordinal.items()]
+            digest_by_account[account] = rows_digest(batch, indices=indices)
+
+        whole = dict(
+            version=MATCHER_VERSION, sha256=self.rules_digest,
+            cents_by_category=cents_by_category, more_merchants=sorted(more_merchants),
+            rollups=rollups_json,
+            cut=cut, len_before=len_before, len_strings=len_strings,
+            digest_before=columns_digest(batch, stop=len_before, len_strings=len_strings),
+            counts_by_account=counts_by_account, digest_by_account=digest_by_account)
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as writing:
+            json.dump(whole, writing)
+        os.replace(tmp_path, self.path)
+
+    def resume_indices(self, batch):
+        """Find the indices of the transactions not yet marked, else None to start over"""
+
+        if self.cut is None:
+            return None
+
+        if not os.path.exists('chase-mark-csv.csv'):
+            self.start_over()
+            return None
+
+        # Require the same transactions before the cut, as found by bisecting the dates
+
+        len_before = bisect.bisect_left(batch.ordinals, self.cut)
+        if (len_before != self.len_before) or (
+                columns_digest(batch, stop=len_before, len_strings=self.len_strings) !=
+                self.digest_before):
+            self.start_over()
+            return None  # some transaction before the cut arrived, went away, or changed
+
+        # Require the same transactions marked past the cut, first of each account each day
+
+        indices = []
+        indices_by_account_ = indices_by_account(batch, start=len_before)
+        for (account, account_indices,) in indices_by_account_.items():
+            count_by_ordinal = dict(self.counts_by_account.get(account, ()))
+
+            marked_indices = []
+            for (ordinal, day_indices,) in indices_by_day(batch, indices=account_indices).items():
+                count = count_by_ordinal.pop(ordinal, 0)
+                if len(day_indices) < count:
+                    self.start_over()
+                    return None  # some transaction marked went away
+
+                marked_indices.extend(day_indices[:count])
+                indices.extend(day_indices[count:])
+
+            if count_by_ordinal:
+                self.start_over()
+                return None  # every transaction marked on some day went away
+
+            if marked_indices:
+                if rows_digest(batch, indices=marked_indices) != self.digest_by_account[account]:
+                    self.start_over()
+                    return None  # some transaction marked changed, or arrived sorted before
+
+        if set(self.counts_by_account.keys()) - set(indices_by_account_.keys()):
+            self.start_over()
+            return None  # some account went away, past the cut
+
+        indices.sort()
+
+        return indices
+
+
+def indices_by_account(batch, start):
+    """List the indices of the transactions of each account, in order, from the start"""
+
+    indices_by_account_index = collections.defaultdict(list)
+    for (index, account_index,) in enumerate(batch.account_indices[start:], start):
+        indices_by_account_index[account_index].append(index)
+
+    indices_by_account_ = dict(
+        (batch.strings[account_index], indices,)
+        for (account_index, indices,) in indices_by_account_index.items())
+
+    return indices_by_account_
+
+
+def indices_by_day(batch, indices):
+    """Group some indices of transactions by day, in order"""
+
+    indices_by_ordinal = dict()
+    for index in indices:
+        indices_by_ordinal.setdefault(batch.ordinals[index], []).append(index)
+
+    return indices_by_ordinal
+
+
+def columns_digest(batch, stop, len_strings):
+    """Digest the dates, amounts, and merchants of the transactions up to a stop, in bulk"""
+
+    hasher = hashlib.sha256()
+    for column in (batch.ordinals, batch.cents, batch.merchant_indices,):
+        hasher.update(memoryview(column)[:stop])  # wart: native byte order
+
+    hasher.update(json.dumps(batch.strings[:len_strings]).encode())
+
+    digest = hasher.hexdigest()
+    return digest
+
+
+def rows_digest(batch, indices):
+    """Digest the date, amount, merchant, and notes of some transactions, in order"""
+
+    strings = batch.strings
+    fields = [
+        (batch.ordinals[_], batch.cents[_],
+            strings[batch.merchant_indices[_]], strings[batch.notes_indices[_]],)
+        for _ in indices]
+
+    digest = hashlib.sha256(json.dumps(fields).encode()).hexdigest()
+    return digest
+
+
+if __name__ == '__main__':
+    main(sys.argv)
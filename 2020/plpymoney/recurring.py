@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+r"""
+Find the charges that recur, such as subscriptions, and multiply them out to yearly costs
+
+Group the charges by merchant, with store numbers dropped, then look only at the days
+between each charge and the next, and at how far each amount strays from the typical amount
+"""
+
+
+import collections
+import csv
+import datetime as dt
+import re
+import statistics
+
+
+RECURRING_PATH = 'recurring-charges-csv.csv'
+
+MERCHANT_NOISE_REGEX = re.compile(r'[0-9#*]+')  # store numbers, card numbers, order numbers
+
+MIN_CHARGES = 3  # charges of one merchant to see before guessing it recurs
+
+CADENCES = (  # (name, days apart, days of slack, charges per year,)
+    ('weekly', 7, 1, 52,),
+    ('biweekly', 14, 2, 26,),
+    ('monthly', 30.44, 3.5, 12,),
+    ('quarterly', 91.31, 8, 4,),
+    ('yearly', 365.25, 12, 1,),
+    )
+
+MIN_PERIODIC_FRACTION = 0.8  # of the days between charges, near the cadence
+MIN_STABLE_FRACTION = 0.8  # of the amounts, near the typical amount
+AMOUNT_SLACK = 0.10  # near means within 10% of the typical amount
+
+
+class Recurrence(object):
+    """Describe one charge that recurs"""
+
+    def __init__(self, merchant, cadence, cents, len_charges, first, last, annual_cents, ended):
+
+        self.merchant = merchant  # with store numbers dropped
+        self.cadence = cadence
+        self.cents = cents  # typical amount of one charge
+        self.len_charges = len_charges
+        self.first = first  # ordinal of first charge
+        self.last = last  # ordinal of last charge
+        self.annual_cents = annual_cents
+        self.ended = ended  # True if not charged lately
+
+
+def normalize_merchant(merchant):
+    """Drop the store numbers and such from a merchant, to group the charges of one business"""
+
+    normalized = ' '.join(MERCHANT_NOISE_REGEX.sub(' ', merchant).upper().split())
+    return normalized
+
+
+def find_recurrences(batch):
+    """Find the charges that recur, in one pass over the rows, then one pass per merchant"""
+
+    # Group the rows of money out by merchant, keeping each group sorted by date
+
+    normalized_by_index = dict()
+    for index in set(batch.merchant_indices):
+        normalized_by_index[index] = normalize_merchant(batch.strings[index])
+
+    ordinals_by_merchant = collections.defaultdict(list)
+    cents_by_merchant = collections.defaultdict(list)
+
+    rows = zip(batch.ordinals, batch.cents, batch.merchant_indices)
+    for (ordinal, cents, merchant_index,) in rows:
+        if cents > 0:
+            merchant = normalized_by_index[merchant_index]
+            ordinals_by_merchant[merchant].append(ordinal)
+            cents_by_merchant[merchant].append(cents)
+
+    last_ordinal = max(batch.ordinals) if len(batch) else 0
+
+    # Judge each merchant by the days between charges, and by the amounts charged
+
+    recurrences = []
+    for (merchant, ordinals,) in ordinals_by_merchant.items():
+        if len(ordinals) < MIN_CHARGES:
+            continue
+
+        amounts = cents_by_merchant[merchant]
+        if any((a > b) for (a, b,) in zip(ordinals, ordinals[1:])):
+            (ordinals, amounts,) = zip(*sorted(zip(ordinals, amounts)))  # wart: Csv not sorted
+
+        recurrence = find_recurrence(
+            merchant, ordinals=ordinals, amounts=amounts, last_ordinal=last_ordinal)
+        if recurrence:
+            recurrences.append(recurrence)
+
+    recurrences.sort(key=lambda _: (_.ended, -_.annual_cents, _.merchant,))
+
+    return recurrences
+
+
+def find_recurrence(merchant, ordinals, amounts, last_ordinal):
+    """Describe the recurrence of the charges of one merchant, else return None"""
+
+    gaps = [(b - a) for (a, b,) in zip(ordinals, ordinals[1:])]
+    median_gap = statistics.median(gaps)
+
+    for (cadence, days, slack, per_year,) in CADENCES:
+        if abs(median_gap - days) > slack:
+            continue
+
+        len_periodic = sum(1 for _ in gaps if abs(_ - days) <= slack)
+        if len_periodic < (MIN_PERIODIC_FRACTION * len(gaps)):
+            return None
+
+        cents = int(statistics.median(amounts))
+        len_stable = sum(1 for _ in amounts if abs(_ - cents) <= (AMOUNT_SLACK * cents))
+        if len_stable < (MIN_STABLE_FRACTION * len(amounts)):
+            return None
+
+        ended = (last_ordinal - ordinals[-1]) > (2 * days + slack)
+
+        recurrence = Recurrence(
+            merchant, cadence=cadence, cents=cents, len_charges=len(ordinals),
+            first=ordinals[0], last=ordinals[-1], annual_cents=(cents * per_year), ended=ended)
+
+        return recurrence
+
+    return None
+
+
+def recurrences_dump(recurrences):
+    """Write the charges that recur, as a Csv table, costliest first, and ended charges last"""
+
+    csv_writer = csv.writer(open(RECURRING_PATH, 'w'))
+
+    csv_writer.writerow(
+        ['', 'Annual', 'Cadence', 'Amount', 'Charges', 'First', 'Last', 'Status', 'Merchant'])
+
+    for recurrence in recurrences:
+        row = (
+            None, recurrence.annual_cents / 1e0 / 100, recurrence.cadence,
+            recurrence.cents / 1e0 / 100, recurrence.len_charges,
+            dt.date.fromordinal(recurrence.first).isoformat(),
+            dt.date.fromordinal(recurrence.last).isoformat(),
+            'ended' if recurrence.ended else 'active', recurrence.merchant,)
+
+        csv_writer.writerow(row)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+r"""
+Sum the cents of transactions by category and by month, week, account, and year, in one pass
+
+Sum with NumPy, if installed, else with plain arrays, and write each sum out as a Csv table,
+with one row per category, and one column per month, per week, per account, or per year
+"""
+
+
+import array
+import csv
+import datetime as dt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+CUBE_PATHS = dict(
+    month='sum-by-category-by-month-csv.csv',
+    week='sum-by-category-by-week-csv.csv',
+    account='sum-by-category-by-account-csv.csv',
+    year='sum-by-category-by-year-csv.csv',
+    )
+
+
+class Cube(object):
+    """Hold sums of cents in a table, with one row per category, and one column per label"""
+
+    def __init__(self, labels, len_categories):
+
+        self.labels = labels
+        self.cents = array.array('q', bytes(8 * len(labels) * len_categories))  # row by row
+
+    def row(self, category_code):
+        """List the sums of one category"""
+
+        width = len(self.labels)
+        row = self.cents[(category_code * width):][:width]
+
+        return row
+
+
+def rollup(batch, category_by_index, use_numpy=True, indices=None):
+    """Sum the cents of money out, by category, by month, week, account, and year"""
+
+    # Sum only the rows at the indices, if given, such as to fold them into sums of rows before,
+    # but label columns for every row, to keep the columns of both sums contiguous
+
+    categories = sorted(set(category_by_index.values()))
+    code_by_category = dict((category, code,) for (code, category,) in enumerate(categories))
+
+    category_codes = [-1] * len(batch.strings)  # by index of merchant string
+    for (index, category,) in category_by_index.items():
+        category_codes[index] = code_by_category[category]
+
+    account_indices = distinct(batch.account_indices, use_numpy=use_numpy)
+    accounts = sorted(set(batch.strings[_] for _ in account_indices))
+    code_by_account = dict((account, code,) for (code, account,) in enumerate(accounts))
+
+    account_codes = [-1] * len(batch.strings)  # by index of account string
+    for (index, string,) in enumerate(batch.strings):
+        account_codes[index] = code_by_account.get(string, -1)
+
+    # Work up the month, week, and year of each distinct day
+
+    ordinals = distinct(batch.ordinals, use_numpy=use_numpy)
+    dates = [dt.date.fromordinal(_) for _ in ordinals]
+
+    month_by_ordinal = dict((o, (d.year * 12 + d.month - 1),) for (o, d,) in zip(ordinals, dates))
+    week_by_ordinal = dict((o, ((o - 1) // 7),) for o in ordinals)  # weeks start on Monday
+    year_by_ordinal = dict((o, d.year,) for (o, d,) in zip(ordinals, dates))
+
+    periods = dict(
+        month=period_range(month_by_ordinal.values()),
+        week=period_range(week_by_ordinal.values()),
+        year=period_range(year_by_ordinal.values()),
+        )
+
+    # Label each column
+
+    labels = dict(
+        month=['{}-{:02}'.format((_ // 12), (_ % 12) + 1) for _ in periods['month']],
+        week=[dt.date.fromordinal(7 * _ + 1).isoformat() for _ in periods['week']],
+        account=accounts,
+        year=[str(_) for _ in periods['year']],
+        )
+
+    cubes = dict((k, Cube(v, len_categories=len(categories)),) for (k, v,) in labels.items())
+
+    # Sum each cube, in one pass, if possible
+
+    columns_by_ordinal = dict(
+        (o, (
+            (month_by_ordinal[o] - periods['month'].start),
+            (week_by_ordinal[o] - periods['week'].start),
+            (year_by_ordinal[o] - periods['year'].start),
+        ),) for o in ordinals)
+
+    if use_numpy and numpy:
+        rollup_numpy(batch, cubes, columns_by_ordinal,
+            category_codes=category_codes, account_codes=account_codes, indices=indices)
+    else:
+        rollup_arrays(batch, cubes, columns_by_ordinal,
+            category_codes=category_codes, account_codes=account_codes, indices=indices)
+
+    return (categories, cubes,)
+
+
+def distinct(column, use_numpy):
+    """List the distinct values of a column of integers, in order"""
+
+    if use_numpy and numpy:
+        values = numpy.unique(numpy.asarray(column, dtype=numpy.int64)).tolist()
+    else:
+        values = sorted(set(column))
+
+    return values
+
+
+def period_range(periods):
+    """Form the range of periods from the first to the last, with no gaps"""
+
+    periods = list(periods)
+    if not periods:
+        return range(0)
+
+    range_ = range(min(periods), max(periods) + 1)
+    return range_
+
+
+def rollup_arrays(batch, cubes, columns_by_ordinal, category_codes, account_codes, indices):
+    """Sum each cube in one pass over the rows, in plain Python"""
+
+    (by_month, by_week, by_account, by_year,) = (
+        cubes['month'], cubes['week'], cubes['account'], cubes['year'],)
+
+    (month_width, week_width, account_width, year_width,) = (
+        len(by_month.labels), len(by_week.labels), len(by_account.labels), len(by_year.labels),)
+
+    columns = (batch.ordinals, batch.cents, batch.merchant_indices, batch.account_indices,)
+
+    rows = zip(*columns)
+    if indices is not None:
+        rows = (tuple(_[index] for _ in columns) for index in indices)
+    for (ordinal, cents, merchant_index, account_index,) in rows:
+        if cents < 0:
+            continue  # money in, as in 'sum-by-category-csv.csv'
+
+        code = category_codes[merchant_index]
+        (month, week, year,) = columns_by_ordinal[ordinal]
+
+        by_month.cents[code * month_width + month] += cents
+        by_week.cents[code * week_width + week] += cents
+        by_account.cents[code * account_width + account_codes[account_index]] += cents
+        by_year.cents[code * year_width + year] += cents
+
+
+def rollup_numpy(batch, cubes, columns_by_ordinal, category_codes, account_codes, indices):
+    """Sum each cube with a few NumPy passes over whole columns"""
+
+    rows = slice(None)
+    if indices is not None:
+        rows = numpy.asarray(indices, dtype=numpy.int64)
+
+    ordinals = numpy.asarray(batch.ordinals, dtype=numpy.int64)[rows]
+    cents = numpy.asarray(batch.cents, dtype=numpy.int64)[rows]
+
+    out = (cents >= 0)  # money out, as in 'sum-by-category-csv.csv'
+    ordinals = ordinals[out]
+    cents = cents[out]
+
+    codes = numpy.asarray(category_codes, dtype=numpy.int64)[
+        numpy.asarray(batch.merchant_indices, dtype=numpy.int64)[rows][out]]
+    accounts = numpy.asarray(account_codes, dtype=numpy.int64)[
+        numpy.asarray(batch.account_indices, dtype=numpy.int64)[rows][out]]
+
+    (distinct_ordinals, inverse,) = numpy.unique(ordinals, return_inverse=True)
+    columns = numpy.asarray(
+        [columns_by_ordinal[_] for _ in distinct_ordinals.tolist()], dtype=numpy.int64)
+    columns = columns.reshape(-1, 3)[inverse]
+
+    column_by_cube = dict(
+        month=columns[:, 0], week=columns[:, 1], account=accounts, year=columns[:, 2])
+
+    for (name, column,) in column_by_cube.items():
+        cube = cubes[name]
+
+        keys = codes * len(cube.labels) + column
+        sums = numpy.bincount(keys, weights=cents, minlength=len(cube.cents))
+            # wart: sums as float, exact only while below 2**53 cents
+
+        cube.cents = array.array('q', numpy.rint(sums).astype(numpy.int64).tobytes())
+
+
+def rollups_merge(before, after):
+    """Fold the sums of the rows after into the sums of the rows before, as if summed at once"""
+
+    categories = sorted(set(before[0]) | set(after[0]))
+    code_by_category = dict((category, code,) for (code, category,) in enumerate(categories))
+
+    cubes = dict()
+    for name in before[-1].keys():
+        labels = sorted(set(before[-1][name].labels) | set(after[-1][name].labels))
+            # wart: contiguous only while the labels after span the labels before
+        column_by_label = dict((label, column,) for (column, label,) in enumerate(labels))
+
+        cube = Cube(labels, len_categories=len(categories))
+        width = len(labels)
+
+        for (categories_, cubes_,) in (before, after,):
+            part = cubes_[name]
+            columns = [column_by_label[_] for _ in part.labels]
+            for (code, category,) in enumerate(categories_):
+                offset = code_by_category[category] * width
+                for (column, cents,) in zip(columns, part.row(code)):
+                    cube.cents[offset + column] += cents
+
+        cubes[name] = cube
+
+    return (categories, cubes,)
+
+
+def rollups_to_json(categories, cubes):
+    """Form the Json of the sums, to fold more rows into them later"""
+
+    json_ = dict(
+        categories=categories,
+        cubes=dict(
+            (name, dict(labels=cube.labels, cents=cube.cents.tolist()),)
+            for (name, cube,) in cubes.items()))
+
+    return json_
+
+
+def rollups_from_json(json_):
+    """Form the sums again, from their Json"""
+
+    cubes = dict()
+    for (name, cube_json,) in json_['cubes'].items():
+        cube = Cube(cube_json['labels'], len_categories=0)
+        cube.cents = array.array('q', cube_json['cents'])
+        cubes[name] = cube
+
+    return (json_['categories'], cubes,)
+
+
+def rollups_dump(categories, cubes):
+    """Write each cube as a Csv table, and add year-over-year changes to the table of years"""
+
+    for (name, cube,) in cubes.items():
+        csv_writer = csv.writer(open(CUBE_PATHS[name], 'w'))
+
+        header_row = ['', 'Category'] + cube.labels
+        if name == 'year':
+            pairs = zip(cube.labels, cube.labels[1:])
+            header_row.extend('{} vs {}'.format(b, a) for (a, b,) in pairs)
+
+        csv_writer.writerow(header_row)
+
+        for (code, category,) in enumerate(categories):
+            row = cube.row(code)
+
+            csv_row = [None, category] + [(_ / 1e0 / 100) for _ in row]
+            if name == 'year':
+                csv_row.extend(((b - a) / 1e0 / 100) for (a, b,) in zip(row, row[1:]))
+
+            csv_writer.writerow(csv_row)
+
+
+def cube_load(name):
+    """Read back one cube, as written by 'rollups_dump', without reading any transaction"""
+
+    csv_reader = csv.reader(open(CUBE_PATHS[name]))
+
+    header_row = next(csv_reader)
+    assert header_row[:2] == ['', 'Category'], header_row
+    labels = header_row[2:]
+    if name == 'year':
+        labels = labels[:((len(labels) + 1) // 2)]  # as the year-over-year changes follow
+
+    categories = []
+    cents = array.array('q')
+    for row in csv_reader:
+        categories.append(row[1])
+        cents.extend(round(float(_) * 100) for _ in row[2:][:len(labels)])
+
+    cube = Cube(labels, len_categories=0)
+    cube.cents = cents
+
+    return (categories, cube,)
@@ -23,5 +23,5 @@ import sys
 import chase
 import mark
 
-chase.main()
-mark.main()
+transactions = chase.stream()  # or 'csv_tap=True' to write 'chase-export-csv.csv' too
+batch = mark.main(transactions=transactions)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+r"""
+Count the wall and cpu time spent in each stage of a run, and write them out as Json
+
+Charge each stretch of time to the innermost stage running, so nested stages never count twice
+"""
+
+
+import collections
+import contextlib
+import json
+import os
+import time
+
+
+STATS_ENV = 'PLPYMONEY_STATS'  # such as 'PLPYMONEY_STATS=1', as if each Py got '--stats'
+
+
+class StageClock(object):
+    """Time the stages of a run, and count things seen along the way"""
+
+    def __init__(self):
+
+        self.wall_by_stage = collections.defaultdict(float)
+        self.cpu_by_stage = collections.defaultdict(float)
+        self.counts = collections.defaultdict(int)
+
+        self.files = []  # Json of the clock of each file, in order
+        self.file_stages = dict()  # sums of the stages of each file, apart from the stages here
+
+        self.stages = []  # names of the stages running, innermost last
+        self.wall = time.perf_counter()  # when last charged
+        self.cpu = time.process_time()
+
+    def charge(self):
+        """Charge the time since last charged to the innermost stage running"""
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        if self.stages:
+            stage = self.stages[-1]
+            self.wall_by_stage[stage] += (wall - self.wall)
+            self.cpu_by_stage[stage] += (cpu - self.cpu)
+
+        self.wall = wall
+        self.cpu = cpu
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Charge the time inside the 'with' to a stage, apart from stages nested inside it"""
+
+        self.charge()
+        self.stages.append(name)
+        try:
+            yield
+        finally:
+            self.charge()
+            self.stages.pop()
+
+    def lap(self, name):
+        """Charge the time since last charged, and charge the time from now to a next stage"""
+
+        self.charge()
+        if self.stages:
+            self.stages.pop()
+        self.stages.append(name)
+
+    def timed(self, name, iterable):
+        """Yield each item of an iterable, charging the time to fetch it to a stage"""
+
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                break
+
+            yield item
+
+    def count(self, name, delta=1):
+        """Count something seen"""
+
+        self.counts[name] += delta
+
+    def add_file(self, filepath, file_json, cached):
+        """Add up the clock of one file, as it ran here or in some other process"""
+
+        self.files.append(dict(filepath=filepath, cached=cached, **file_json))
+
+        for (name, seconds,) in file_json['stages'].items():
+            sums = self.file_stages.setdefault(name, dict(wall_seconds=0.0, cpu_seconds=0.0))
+            sums['wall_seconds'] += seconds['wall_seconds']
+            sums['cpu_seconds'] += seconds['cpu_seconds']
+
+        for (name, delta,) in file_json['counts'].items():
+            self.count(name, delta=delta)
+
+    def to_json(self):
+        """Form the Json of this clock, with Transactions per second, if any counted"""
+
+        self.charge()
+
+        stages = dict()
+        for name in self.wall_by_stage.keys():
+            stages[name] = dict(
+                wall_seconds=self.wall_by_stage[name], cpu_seconds=self.cpu_by_stage[name])
+
+        wall_seconds = sum(self.wall_by_stage.values())
+        cpu_seconds = sum(self.cpu_by_stage.values())
+
+        transactions_per_second = None
+        if wall_seconds:
+            transactions_per_second = self.counts['transactions'] / wall_seconds
+
+        json_ = dict(
+            wall_seconds=wall_seconds, cpu_seconds=cpu_seconds,
+            transactions_per_second=transactions_per_second,
+            stages=stages, counts=dict(self.counts))
+
+        if self.files:
+            json_['file_stages'] = self.file_stages  # summed across processes, if in parallel
+            json_['files'] = self.files
+
+        return json_
+
+
+def stats_wanted(args_stats):
+    """Say if the command line or the environment asks for stats"""
+
+    wanted = args_stats or bool(os.environ.get(STATS_ENV))
+    return wanted
+
+
+def stats_dump(path, clock, program):
+    """Write the Json of a clock, all at once, never leaving it half written"""
+
+    json_ = dict(program=program, when=time.strftime('%Y-%m-%dT%H:%M:%S'), **clock.to_json())
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as writing:
+        json.dump(json_, writing, indent=2)
+        writing.write('\n')
+
+    os.replace(tmp_path, path)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+r"""
+Keep transactions in a SQLite file, and sum them by date range, account, merchant, or category
+
+Load every transaction again at each export, in one SQLite transaction, keeping each row
+found before, and dropping each row not found again, so that loading twice changes nothing
+
+examples:
+  python3 store.py  # sum by category
+  python3 store.py --since 2019-01-01 --until 2019-12-31 --by month
+  python3 store.py --merchant 'AMAZON%' --by merchant
+  python3 store.py --category Groceries --by account
+"""
+
+
+import argparse
+import collections
+import csv
+import os
+import sqlite3
+import sys
+import time
+
+
+STORE_PATH = 'chase-ledger.sqlite'
+
+STORE_SCHEMA = r"""
+    CREATE TABLE IF NOT EXISTS transactions (
+        day TEXT NOT NULL,  -- as Yyyy-mm-dd
+        cents INTEGER NOT NULL,  -- negative for money in
+        merchant TEXT NOT NULL,
+        notes TEXT NOT NULL,
+        account TEXT NOT NULL,
+        rank INTEGER NOT NULL,  -- 1, 2, 3, etc to count rows alike, as chase.Dedup does
+        category TEXT,  -- as last marked by Mark Py, else NULL
+        load INTEGER NOT NULL  -- the last load to find this row
+    );
+
+    CREATE UNIQUE INDEX IF NOT EXISTS transactions_by_key
+        ON transactions (account, day, cents, merchant, rank);
+
+    CREATE INDEX IF NOT EXISTS transactions_by_day ON transactions (day, cents);
+    CREATE INDEX IF NOT EXISTS transactions_by_account ON transactions (account, day, cents);
+    CREATE INDEX IF NOT EXISTS transactions_by_merchant ON transactions (merchant, day, cents);
+    CREATE INDEX IF NOT EXISTS transactions_by_category ON transactions (category, day, cents);
+
+    CREATE TABLE IF NOT EXISTS categories (
+        merchant TEXT PRIMARY KEY,
+        category TEXT NOT NULL
+    );
+"""
+
+STORE_UPSERT = r"""
+    INSERT INTO transactions (day, cents, merchant, notes, account, rank, category, load)
+        VALUES (?, ?, ?, ?, ?, ?, (SELECT category FROM categories WHERE merchant = ?), ?)
+        ON CONFLICT (account, day, cents, merchant, rank)
+        DO UPDATE SET notes = excluded.notes, load = excluded.load
+"""
+
+GROUPS = dict(  # the Sql to group rows by, for each choice of '--by'
+    category="COALESCE(category, '')",
+    merchant='merchant',
+    account='account',
+    month='SUBSTR(day, 1, 7)',
+    year='SUBSTR(day, 1, 4)',
+    day='day',
+    )
+
+
+def main(argv):
+    """Run from the command line"""
+
+    when_launched = time.perf_counter()
+
+    parser = store_compile_argdoc()
+    args = parser.parse_args(argv[1:])
+
+    if not os.path.exists(STORE_PATH):
+        parser.error('no {!r} here, run chase.py --store first'.format(STORE_PATH))
+
+    connection = sqlite3.connect(STORE_PATH)
+    rows = store_query(connection,
+        by=args.by, since=args.since, until=args.until,
+        account=args.account, merchant=args.merchant, category=args.category)
+
+    csv_writer = csv.writer(sys.stdout)
+    csv_writer.writerow(['', 'Out', 'In', 'Rows', args.by.title()])
+    for (group, out_cents, in_cents, len_rows,) in rows:
+        csv_writer.writerow((None, out_cents / 1e0 / 100, in_cents / 1e0 / 100, len_rows, group,))
+
+    print('Store Py answered inside {:.3f}s'.format(time.perf_counter() - when_launched),
+        file=sys.stderr)
+
+
+def store_compile_argdoc():
+    """Construct the helplines for a parser, and the parser itself, to parse a command line"""
+
+    doc = __doc__.strip()
+    doc_lines = doc.splitlines()
+    description = doc_lines[0]
+    epilog = doc[doc.index('examples:'):]
+
+    parser = argparse.ArgumentParser(
+        prog='store',
+        description=description,
+        epilog=epilog,
+        formatter_class=argparse.RawTextHelpFormatter,
+        )
+
+    parser.add_argument('--by', choices=sorted(GROUPS.keys()), default='category',
+        help='sum by this (default: category)')
+    parser.add_argument('--since', metavar='YYYY-MM-DD', help='sum only rows of this day or later')
+    parser.add_argument('--until', metavar='YYYY-MM-DD',
+        help='sum only rows of this day or earlier')
+    parser.add_argument('--account', metavar='DIGITS', help='sum only rows of this account')
+    parser.add_argument('--merchant', metavar='LIKE',
+        help='sum only rows of this merchant, or of merchants like it, with %% or _ as wildcards,\n'
+            'ignoring the case of Ascii letters, as SQLite LIKE does')
+    parser.add_argument('--category', metavar='NAME',
+        help='sum only rows of this category, or pass \'\' for rows uncategorized')
+
+    return parser
+
+
+def store_connect(path):
+    """Open a SQLite file of transactions, adding its tables and indexes, if missing"""
+
+    connection = sqlite3.connect(path)
+    connection.executescript(STORE_SCHEMA)
+
+    return connection
+
+
+def store_load(path, transactions):
+    """Load transactions into a SQLite file, in one SQLite transaction, in bulk"""
+
+    connection = store_connect(path)
+    with connection:  # commits, else rolls back
+
+        sql = 'SELECT COALESCE(MAX(load), 0) + 1 FROM transactions'
+        (load,) = connection.execute(sql).fetchone()
+
+        rank_by_key = collections.Counter()
+
+        params = []
+        for transaction in transactions:
+            day = transaction.ymd()
+            key = (transaction.account, day, transaction.cents, transaction.merchant,)
+
+            rank_by_key[key] += 1
+            params.append(key[1:3] + (
+                transaction.merchant, transaction.notes, transaction.account, rank_by_key[key],
+                transaction.merchant, load,))
+
+        connection.executemany(STORE_UPSERT, params)
+        connection.execute('DELETE FROM transactions WHERE load != ?', (load,))
+
+    connection.close()
+
+
+def store_mark(path, category_by_merchant):
+    """Mark each transaction of each merchant with its category, in one SQLite transaction"""
+
+    connection = store_connect(path)
+    with connection:
+
+        params = sorted(category_by_merchant.items())
+        connection.executemany(
+            'INSERT INTO categories (merchant, category) VALUES (?, ?)'
+            ' ON CONFLICT (merchant) DO UPDATE SET category = excluded.category', params)
+
+        params = [(category, merchant,) for (merchant, category,) in params]
+        connection.executemany(
+            'UPDATE transactions SET category = ? WHERE merchant = ?', params)
+
+    connection.close()
+
+
+def store_query(connection, by, since, until, account, merchant, category):
+    """Sum the money out, the money in, and the rows, of each group of the rows asked for"""
+
+    wheres = []
+    params = []
+
+    if since:
+        wheres.append('day >= ?')
+        params.append(since)
+    if until:
+        wheres.append('day <= ?')
+        params.append(until)
+    if account is not None:
+        wheres.append('account = ?')
+        params.append(account)
+    if merchant is not None:
+        like = ('%' in merchant) or ('_' in merchant)
+        wheres.append('merchant LIKE ?' if like else 'merchant = ?')
+        params.append(merchant)
+    if category is not None:
+        wheres.append('category = ?' if category else "COALESCE(category, '') = ''")
+        params.extend([category] if category else [])
+
+    group = GROUPS[by]
+    sql = (
+        'SELECT {group} AS grouped,'
+        ' SUM(MAX(cents, 0)), SUM(MIN(cents, 0)), COUNT(*)'
+        ' FROM transactions {where}'
+        ' GROUP BY grouped ORDER BY SUM(MAX(cents, 0)) DESC, grouped'
+        ).format(group=group, where=('WHERE ' + ' AND '.join(wheres)) if wheres else '')
+
+    rows = connection.execute(sql, params).fetchall()
+    return rows
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+r"""
+Watch a Dir of Dir's downloaded from Chase Bank, and mark each statement soon after it arrives
+
+Poll with 'os.scandir' only the dirs whose mtime changed, and stat only the Pdf's found before,
+then parse only the Pdf's that arrived or changed, once they stop changing
+"""
+
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+import chase
+import ledger
+import mark
+import stages
+
+
+POLL_SECONDS = 0.25
+SETTLE_SECONDS = 0.5
+
+
+def main(argv):
+    """Run from the command line"""
+
+    parser = watch_compile_argdoc()
+    args = parser.parse_args(argv[1:])
+
+    watcher = TreeWatcher('.', settle_seconds=args.settle)
+    watcher.poll()  # to find every Pdf already downloaded
+
+    folder = StatementFolder(csv_tap=args.csv_tap)
+    folder.update(watcher.accept_all(), removed_filepaths=[])
+
+    print('Watch Py watching', len(watcher.published), 'Pdf\'s, press Control+C to quit')
+
+    try:
+        while True:
+            time.sleep(args.interval)
+
+            (settled, removed,) = watcher.poll()
+            if settled or removed:
+                folder.update(settled, removed_filepaths=removed)
+    except KeyboardInterrupt:
+        pass
+
+
+def watch_compile_argdoc():
+    """Construct the helplines for a parser, and the parser itself, to parse a command line"""
+
+    parser = argparse.ArgumentParser(
+        prog='watch',
+        formatter_class=argparse.RawTextHelpFormatter,
+        )
+
+    parser.add_argument('--interval', metavar='SECONDS', type=float, default=POLL_SECONDS,
+        help='poll this often (default: {})'.format(POLL_SECONDS))
+    parser.add_argument('--settle', metavar='SECONDS', type=float, default=SETTLE_SECONDS,
+        help='wait till a Pdf stops changing for this long (default: {})'.format(SETTLE_SECONDS))
+    parser.add_argument('--csv-tap', action='store_true',
+        help='write {!r} at each update too'.format('chase-export-csv.csv'))
+
+    return parser
+
+
+class TreeWatcher(object):
+    """Find the Pdf's that arrived, changed, or went away, since last published"""
+
+    def __init__(self, top, settle_seconds):
+
+        self.top = top
+        self.settle_seconds = settle_seconds
+
+        self.mtime_by_dirpath = dict()  # st_mtime_ns of each dir when last scanned
+        self.subdirs_by_dirpath = dict()
+        self.pdfs_by_dirpath = dict()
+
+        self.published = dict()  # (st_size, st_mtime_ns,) of each Pdf, as last published
+        self.pending = dict()  # ((st_size, st_mtime_ns,), when first seen,) of each Pdf changing
+
+    def poll(self):
+        """Rescan the dirs that changed, and return the Pdf's settled, and the Pdf's gone"""
+
+        # Rescan only the dirs whose mtime changed
+
+        if not self.mtime_by_dirpath:
+            self.scan_dir(self.top)
+
+        for dirpath in list(self.mtime_by_dirpath.keys()):
+            if dirpath not in self.mtime_by_dirpath:
+                continue  # forgot it while rescanning its parent
+
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                self.forget_dir(dirpath)
+                continue
+
+            if mtime != self.mtime_by_dirpath[dirpath]:
+                self.scan_dir(dirpath)
+
+        # Stat only the Pdf's found
+
+        now = time.monotonic()
+
+        settled = []
+        filepaths = set()
+        for pdfs in self.pdfs_by_dirpath.values():
+            for filepath in pdfs:
+                filepaths.add(filepath)
+
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+
+                key = (stat.st_size, stat.st_mtime_ns,)
+                if self.published.get(filepath) == key:
+                    self.pending.pop(filepath, None)
+                    continue
+
+                pending = self.pending.get(filepath)
+                if (not pending) or (pending[0] != key):
+                    self.pending[filepath] = (key, now,)
+                elif (now - pending[-1]) >= self.settle_seconds:
+                    del self.pending[filepath]
+                    self.published[filepath] = key
+                    settled.append(filepath)
+
+        removed = sorted(_ for _ in self.published.keys() if _ not in filepaths)
+        for filepath in removed:
+            del self.published[filepath]
+
+        return (sorted(settled, key=walk_order), removed,)
+
+    def accept_all(self):
+        """Publish every Pdf found, as if each had settled"""
+
+        for pdfs in self.pdfs_by_dirpath.values():
+            for filepath in pdfs:
+                stat = os.stat(filepath)
+                self.published[filepath] = (stat.st_size, stat.st_mtime_ns,)
+
+        self.pending.clear()
+
+        filepaths = sorted(self.published.keys(), key=walk_order)
+        return filepaths
+
+    def scan_dir(self, dirpath):
+        """Find the Pdf statements of a dir, and scan each subdir not scanned before"""
+
+        try:
+            mtime = os.stat(dirpath).st_mtime_ns
+            with os.scandir(dirpath) as entries:
+                entries = list(entries)
+        except OSError:
+            self.forget_dir(dirpath)
+            return
+
+        self.mtime_by_dirpath[dirpath] = mtime
+
+        dir_matched = chase.STATEMENT_DIR_REGEX.search(os.path.basename(dirpath))
+
+        subdirs = set()
+        pdfs = set()
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith('.'):
+                    if entry.name != chase.PARTITIONS_DIR:
+                        subdirs.add(entry.path)
+            elif dir_matched:
+                file_matched = chase.STATEMENT_FILE_REGEX.match(entry.name)
+                if file_matched and (file_matched.group(1) == dir_matched.group(2)):
+                    pdfs.add(entry.path)
+
+        for subdir in self.subdirs_by_dirpath.get(dirpath, set()) - subdirs:
+            self.forget_dir(subdir)
+
+        self.subdirs_by_dirpath[dirpath] = subdirs
+        self.pdfs_by_dirpath[dirpath] = pdfs
+
+        for subdir in sorted(subdirs):
+            if subdir not in self.mtime_by_dirpath:
+                self.scan_dir(subdir)
+
+    def forget_dir(self, dirpath):
+        """Forget a dir gone, and the dirs inside it"""
+
+        self.mtime_by_dirpath.pop(dirpath, None)
+        self.pdfs_by_dirpath.pop(dirpath, None)
+
+        for subdir in self.subdirs_by_dirpath.pop(dirpath, set()):
+            self.forget_dir(subdir)
+
+
+def walk_order(filepath):
+    """Sort Pdf's as 'os.walk' with sorted names would, each dir's files before its subdirs"""
+
+    (dirpath, filename,) = os.path.split(filepath)
+    key = (dirpath.split(os.sep), filename,)
+
+    return key
+
+
+class StatementFolder(object):
+    """Parse each Pdf as it arrives, then dedup, sort, and mark all again, as Chase Py would"""
+
+    def __init__(self, csv_tap):
+
+        self.csv_tap = csv_tap
+
+        self.cache = chase.ParseCache(chase.CACHE_PATH, max_rows=chase.CACHE_MAX_ROWS)
+        self.cache.load()
+
+        self.filepaths = set()  # each Pdf published, except the Pdf's that failed to parse
+
+    def update(self, filepaths, removed_filepaths):
+        """Parse only the Pdf's that arrived or changed, then sort, dedup, and mark all again"""
+
+        when_launched = time.monotonic()
+
+        self.filepaths.difference_update(removed_filepaths)
+
+        clock = stages.StageClock()
+        for filepath in filepaths:
+            self.filepaths.discard(filepath)
+
+            if self.cache.lookup(filepath) is None:
+                try:
+                    (transactions, _,) = chase.pdf_parse_filepath(filepath)
+                except Exception as exc:  # wart: keeps watching, past a Pdf that fails to parse
+                    print('Watch Py failed to parse {!r}: {!r}'.format(filepath, exc))
+                    continue
+
+                self.cache.store(filepath, transactions=transactions)
+
+            self.filepaths.add(filepath)
+
+        # Skip Pdf's of the same bytes, then dedup and sort each account, as Chase Py would
+
+        dedup = chase.Dedup()
+        kept_filepaths = [
+            _ for _ in sorted(self.filepaths, key=walk_order)
+            if not dedup.skip_filepath(_, cache=self.cache)]
+
+        (partitions, dedup.drops,) = chase.partition_filepaths(
+            kept_filepaths, cache=self.cache, clock=clock, processes=1,
+            sort_max_rows=chase.SORT_MAX_ROWS, keep_duplicates=False)
+
+        self.cache.dump()
+        dedup.dump(chase.DROPPED_PATH)
+
+        batch = ledger.TransactionBatch()
+        batch.extend(chase.merge_partitions(partitions, filepaths=kept_filepaths))
+
+        if self.csv_tap:
+            csv_writer = csv.writer(open('chase-export-csv.csv', 'w'))
+            csv_writer.writerow(('', 'Yyyy-mm-dd', 'Amount', 'Merchant', 'Notes',))
+            csv_writer.writerows(_.to_row() for _ in batch)
+
+        # Mark them, folding in only the Transactions not marked before, when possible
+
+        mark.main(['mark', '--incremental'], batch=batch)
+
+        print('Watch Py updated {} Pdf\'s, with {} gone, inside {:.3f}s'.format(
+            len(filepaths), len(removed_filepaths), time.monotonic() - when_launched))
+
+
+if __name__ == '__main__':
+    main(sys.argv)